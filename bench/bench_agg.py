@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""ns/trade and bytes per open bucket: legacy dict-of-lists aggregator vs utils/agg.py.
+
+    python bench/bench_agg.py --trades 500000 --batch 500
+"""
+import argparse, random, sys, time, tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "orderflow"))
+
+import numpy as np  # noqa: E402
+from utils import agg  # noqa: E402
+
+KEYS = [(ex, sym) for ex in ("binance", "bybit") for sym in ("BTCUSDT", "BTCUSD")]
+
+def legacy_aggregator():
+    """The pre-array implementation: tuple key => [vol, px_qty_sum, trades, min_px, max_px]."""
+    buckets = defaultdict(lambda: [0.0, 0.0, 0, float("inf"), 0.0])
+    def add_trade(exchange, symbol, side, price, qty, ts_ms):
+        b = buckets[(exchange, symbol, side, ts_ms // 1000)]
+        b[0] += qty; b[1] += price * qty; b[2] += 1
+        b[3] = min(b[3], price); b[4] = max(b[4], price)
+    return buckets, add_trade
+
+def make_trades(n:int, seconds:int):
+    t0 = 1_700_000_000_000
+    ts = np.sort(np.random.randint(t0, t0 + seconds * 1000, n))
+    k = np.random.randint(0, len(KEYS), n)
+    return {
+        "ex": [KEYS[i][0] for i in k], "sym": [KEYS[i][1] for i in k],
+        "side": [random.choice(agg.SIDES) for _ in range(n)],
+        "px": (60_000 + np.random.randn(n) * 20).tolist(), "qty": np.random.exponential(0.05, n).tolist(),
+        "ts": ts.tolist(),
+    }
+
+def reset_agg():
+    agg.trade_buckets = agg.BucketStore()
+
+def run_legacy(tr):
+    buckets, add = legacy_aggregator()
+    for row in zip(tr["ex"], tr["sym"], tr["side"], tr["px"], tr["qty"], tr["ts"]):
+        add(*row)
+    return buckets
+
+def run_scalar(tr):
+    reset_agg()
+    for row in zip(tr["ex"], tr["sym"], tr["side"], tr["px"], tr["qty"], tr["ts"]):
+        agg.add_trade(*row)
+    return agg.trade_buckets
+
+def run_batched(tr, batch:int):
+    reset_agg()
+    sid = [agg.series_id(e, s) for e, s in zip(tr["ex"], tr["sym"])]
+    side = [agg.SIDE_CODE[s] for s in tr["side"]]
+    for i in range(0, len(sid), batch):
+        agg.add_trades({"sid": sid[i:i + batch], "side": side[i:i + batch], "px": tr["px"][i:i + batch],
+                        "qty": tr["qty"][i:i + batch], "ts": tr["ts"][i:i + batch]})
+    return agg.trade_buckets
+
+def measure(name, fn, n):
+    tracemalloc.start()
+    t = time.perf_counter(); store = fn(); dt = time.perf_counter() - t
+    mem = tracemalloc.get_traced_memory()[0]; tracemalloc.stop()
+    t = time.perf_counter(); fn(); dt = min(dt, time.perf_counter() - t)  # second run without tracing overhead
+    print(f"{name:<22} {dt / n * 1e9:8.0f} ns/trade  {len(store):>8} buckets  {mem / max(len(store), 1):8.0f} B/bucket")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trades", type=int, default=500_000)
+    ap.add_argument("--seconds", type=int, default=3_600, help="event-time span, i.e. how many 1s buckets stay open")
+    ap.add_argument("--batch", type=int, default=500, help="xreadgroup batch size fed to add_trades")
+    args = ap.parse_args()
+    tr = make_trades(args.trades, args.seconds)
+    measure("legacy dict add_trade", lambda: run_legacy(tr), args.trades)
+    measure("array add_trade", lambda: run_scalar(tr), args.trades)
+    measure(f"array add_trades/{args.batch}", lambda: run_batched(tr, args.batch), args.trades)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Replay throughput of the L2 book engine: frame decode + sequence check + apply, on one core.
+
+    python bench/bench_book.py --frames 20000                       # synthetic BTCUSDT @depth@100ms diffs
+    python bench/bench_book.py --exchange bybit --frames 20000
+    # real frames: record the diff stream, then a REST snapshot taken while it ran
+    python bench/replay_ws.py record --url 'wss://fstream.binance.com/stream?streams=btcusdt@depth@100ms' --seconds 120 --out depth.jsonl
+    python bench/bench_book.py --frames-file depth.jsonl --snapshot-file snap.json
+
+Frames go through `collector.parse_binance_depth` / `parse_bybit_book`, i.e. the socket's hot path minus
+the network. Reports frames/s and level updates/s against the live rate of the recording (synthetic frames
+are spaced 100 ms apart), per-frame latency, and the cost of one feature computation. With `--check` the
+final book is compared against a plain dict book fed the same diffs.
+"""
+import argparse, asyncio, json, random, sys, time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "orderflow")); sys.path.insert(0, str(HERE))
+
+import replay_ws  # noqa: E402
+
+TICK = 0.1
+
+def synth_book(levels:int, mid:float) -> tuple:
+    bids = {round(mid - TICK * (i + 1), 1): random.expovariate(1) for i in range(levels)}
+    asks = {round(mid + TICK * (i + 1), 1): random.expovariate(1) for i in range(levels)}
+    return bids, asks
+
+def synth_frames(exchange:str, n:int, per_frame:int, symbol:str="BTCUSDT", levels:int=1000) -> tuple:
+    """A snapshot plus `n` consecutive diffs 100 ms apart: ~`per_frame` level changes each, concentrated near a
+    random-walking mid, a quarter of them deletions, and levels the mid walked through removed. Returns (snapshot message, [(t, raw)])."""
+    mid = 60_000.0
+    bids, asks = synth_book(levels, mid)
+    t0 = int(time.time() * 1000)
+    fmt = lambda side: [[f"{p:.1f}", f"{q:.3f}"] for p, q in side.items()]
+    if exchange == "binance":
+        snap = {"lastUpdateId": 1001, "E": t0, "T": t0, "bids": fmt(bids), "asks": fmt(asks)}
+    else:
+        snap = {"topic": f"orderbook.200.{symbol}", "type": "snapshot", "ts": t0,
+                "data": {"s": symbol, "b": fmt(bids), "a": fmt(asks), "u": 1000, "seq": 1}}
+    frames, u = [], 1000
+    for i in range(n):
+        mid = round(mid + random.gauss(0, 2) * TICK, 1)
+        b = {p: 0.0 for p in bids if p >= mid}  # the touch moved: levels it crossed are removed
+        a = {p: 0.0 for p in asks if p <= mid}
+        for _ in range(max(1, int(random.expovariate(1 / per_frame)))):
+            dist = round(TICK * (1 + int(random.expovariate(1 / 40))), 1)
+            side, px = (b, round(mid - dist, 1)) if random.random() < 0.5 else (a, round(mid + dist, 1))
+            side[px] = 0.0 if random.random() < 0.25 else random.expovariate(1)
+        for book, diff in ((bids, b), (asks, a)):
+            for p, q in diff.items():
+                if q:
+                    book[p] = q
+                else:
+                    book.pop(p, None)
+        ts = t0 + 100 * (i + 1)
+        if exchange == "binance":
+            d = {"e": "depthUpdate", "E": ts, "T": ts, "s": symbol, "U": u + 1, "u": u + len(b) + len(a), "pu": u,
+                 "b": [[f"{p:.1f}", f"{q:.3f}"] for p, q in b.items()], "a": [[f"{p:.1f}", f"{q:.3f}"] for p, q in a.items()]}
+            u = d["u"]
+            raw = {"stream": f"{symbol.lower()}@depth@100ms", "data": d}
+        else:
+            u += 1
+            raw = {"topic": f"orderbook.200.{symbol}", "type": "delta", "ts": ts, "data": {
+                "s": symbol, "u": u, "seq": u, "b": [[f"{p:.1f}", f"{q:.3f}"] for p, q in b.items()],
+                "a": [[f"{p:.1f}", f"{q:.3f}"] for p, q in a.items()]}}
+        frames.append((i * 0.1, json.dumps(raw, separators=(",", ":"))))
+    return snap, frames
+
+def reference(snap:dict, frames:list, exchange:str) -> tuple:
+    """Dict book fed the same messages, for --check."""
+    b, a = (snap["bids"], snap["asks"]) if exchange == "binance" else (snap["data"]["b"], snap["data"]["a"])
+    # a snapshot level can round to "0.000"; the book never keeps zero quantities
+    bids = {float(p): float(q) for p, q in b if float(q) > 0}; asks = {float(p): float(q) for p, q in a if float(q) > 0}
+    for _, raw in frames:
+        m = json.loads(raw); d = m["data"]
+        if exchange == "binance" and d["u"] < snap["lastUpdateId"]:
+            continue
+        for side, rows in ((bids, d["b"]), (asks, d["a"])):
+            for p, q in rows:
+                if float(q) == 0:
+                    side.pop(float(p), None)
+                else:
+                    side[float(p)] = float(q)
+    return bids, asks
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else float("nan")
+
+def run(args):
+    import numpy as np
+    import collector
+    from utils.book import BinanceBook, BybitBook
+
+    if args.frames_file:
+        frames = replay_ws.load_frames(args.frames_file)
+        if args.snapshot_file:
+            snap = json.loads(Path(args.snapshot_file).read_text())
+        else:  # no snapshot: bridge from an empty book at the first diff, same work per frame
+            first = json.loads(frames[0][1])["data"]
+            snap = {"lastUpdateId": first["U"], "bids": [], "asks": []}
+    else:
+        snap, frames = synth_frames(args.exchange, args.frames, args.per_frame)
+    sym = "BTCUSDT"
+    if args.exchange == "binance":
+        book = BinanceBook("binance", sym, args.max_levels)
+        books, wanted = {sym: book}, {sym: asyncio.Event()}
+        parse = lambda raw: collector.parse_binance_depth(raw, books, wanted)
+        book.on_snapshot(snap)
+    else:
+        book = BybitBook("bybit", sym, args.max_levels)
+        books = {sym: book}
+        parse = lambda raw: collector.parse_bybit_book(raw, books)
+        parse(json.dumps(snap))
+    resyncs = []
+    book.on_resync = lambda b, reason: resyncs.append(reason)
+
+    n_levels = sum(len(m["data"]["b"]) + len(m["data"]["a"]) for m in (json.loads(raw) for _, raw in frames))
+    lat = []
+    t0 = time.perf_counter()
+    for _, raw in frames:
+        t = time.perf_counter(); parse(raw); lat.append(time.perf_counter() - t)
+    sec = time.perf_counter() - t0
+    live = frames[-1][0] - frames[0][0] if len(frames) > 1 else 0
+    ft = []
+    for _ in range(1000):
+        t = time.perf_counter(); book.features(); ft.append(time.perf_counter() - t)
+
+    print(f"{args.exchange} {len(frames):,} frames, {n_levels:,} level updates ({n_levels / len(frames):.0f}/frame), "
+          f"book {len(book.bids)} bids / {len(book.asks)} asks, synced {book.synced}, resyncs {len(resyncs)}")
+    print(f"replayed in {sec:.2f}s: {len(frames) / sec:,.0f} frames/s, {n_levels / sec:,.0f} levels/s; "
+          f"per frame p50 {pct(lat, .5) * 1e6:.0f} us, p99 {pct(lat, .99) * 1e6:.0f} us")
+    if live > 0:
+        print(f"live rate {len(frames) / live:,.1f} frames/s: {live / sec:,.0f}x real time on one core")
+    print(f"features p50 {pct(ft, .5) * 1e6:.0f} us: {book.features()}")
+    if args.check:
+        bids, asks = reference(snap, frames, args.exchange)
+        rb, ra = np.array(sorted(bids.items())), np.array(sorted(asks.items()))  # valid while no side was trimmed
+        ok = (np.array_equal(rb[:, 0], book.bids.px) and np.array_equal(rb[:, 1], book.bids.qty)
+              and np.array_equal(ra[:, 0], book.asks.px) and np.array_equal(ra[:, 1], book.asks.qty))
+        print(f"check against dict book: {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            sys.exit(1)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--exchange", choices=("binance", "bybit"), default="binance")
+    ap.add_argument("--frames", type=int, default=20_000, help="synthetic frames (100 ms apart)")
+    ap.add_argument("--per-frame", type=int, default=150, help="mean level changes per synthetic frame")
+    ap.add_argument("--frames-file", help="frames recorded with replay_ws.py record (Binance depth stream)")
+    ap.add_argument("--snapshot-file", help="REST depth snapshot JSON taken while the frames were recorded")
+    ap.add_argument("--max-levels", type=int, default=5000)
+    ap.add_argument("--check", action="store_true", help="compare the final book with a dict reference")
+    run(ap.parse_args())
+
+if __name__ == "__main__":
+    main()
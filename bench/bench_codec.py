@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Stream bytes/trade and writer decode ns/trade: legacy string entries vs packed codec batches.
+
+    python bench/bench_codec.py --trades 200000 --batch 200 [--redis redis://localhost:6379/0]
+
+Bytes are measured with MEMORY USAGE on a scratch stream (real Redis only); decode time covers
+turning an xreadgroup reply into the columnar batch `agg.add_trades` takes.
+"""
+import argparse, asyncio, random, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "orderflow"))
+
+from utils import agg  # noqa: E402
+from utils.codec import encode_trades, decode_entries  # noqa: E402
+
+def make_trades(n:int):
+    t0 = int(time.time() * 1000)
+    return [{"ex": random.choice(("binance", "bybit")), "sym": random.choice(("BTCUSDT", "BTCUSD")),
+             "side": random.choice(agg.SIDES), "px": f"{60_000 + random.random() * 100:.1f}",
+             "qty": f"{random.expovariate(20):.3f}", "ts": str(t0 + i)} for i in range(n)]
+
+def as_reply(fields_list):
+    """Shape of a decode_responses=False xreadgroup reply."""
+    enc = lambda v: v if isinstance(v, bytes) else str(v).encode()
+    return [(f"{i}-0".encode(), {k.encode(): enc(v) for k, v in f.items()}) for i, f in enumerate(fields_list)]
+
+async def stream_bytes(url:str, fields_list) -> int:
+    import redis.asyncio as aioredis
+    r = aioredis.from_url(url)
+    try:
+        await r.delete("bench:codec")
+        async with r.pipeline(transaction=False) as pipe:
+            for f in fields_list:
+                pipe.xadd("bench:codec", f)
+            await pipe.execute()
+        return await r.memory_usage("bench:codec", samples=0)
+    finally:
+        await r.delete("bench:codec"); await r.close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trades", type=int, default=200_000)
+    ap.add_argument("--batch", type=int, default=200, help="trades per packed entry (collector PUBLISH_BATCH)")
+    ap.add_argument("--read-count", type=int, default=500, help="entries per xreadgroup reply")
+    ap.add_argument("--redis")
+    args = ap.parse_args()
+    trades = make_trades(args.trades)
+    formats = {"legacy": trades, "packed": [encode_trades(trades[i:i + args.batch]) for i in range(0, len(trades), args.batch)]}
+    for name, fields_list in formats.items():
+        reply = as_reply(fields_list)
+        t = time.perf_counter()
+        for i in range(0, len(reply), args.read_count):
+            decode_entries(reply[i:i + args.read_count], agg.series_id)
+        dt = time.perf_counter() - t
+        line = f"{name:<7} {len(reply):>8} entries  decode {dt / len(trades) * 1e9:7.0f} ns/trade"
+        if args.redis:
+            line += f"  {asyncio.run(stream_bytes(args.redis, fields_list)) / len(trades):6.1f} B/trade in Redis"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Sustained WS msgs/s and XADD publish latency of the collector, fed by the local replay server.
+
+    python bench/bench_collector.py --exchange bybit --frames 100000             # synthetic frames, fakeredis
+    python bench/bench_collector.py --frames-file frames.jsonl --redis redis://localhost:6379/0
+
+Publish latency is the age of the oldest event in each pipeline flush when Redis acknowledged it.
+"""
+import argparse, asyncio, os, sys, time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "orderflow")); sys.path.insert(0, str(HERE))
+
+import replay_ws  # noqa: E402
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else float("nan")
+
+async def run(args):
+    frames = replay_ws.load_frames(args.frames_file) if args.frames_file else replay_ws.synth_frames(args.exchange, args.frames)
+    url = f"ws://127.0.0.1:{args.port}"
+    os.environ["BINANCE_UM_WS"] = os.environ["BYBIT_LINEAR_WS"] = url  # settings reads these at import
+    import collector
+    from utils import redis_client as rds
+    if args.redis:
+        import redis.asyncio as aioredis
+        rds.redis_client = aioredis.from_url(args.redis)
+    else:
+        import fakeredis
+        rds.redis_client = fakeredis.aioredis.FakeRedis()
+
+    parse = collector.parse_binance if args.exchange == "binance" else collector.parse_bybit
+    syms = {"BTCUSDT": "BTCUSDT"}
+    expected = sum(len(parse(raw, syms)) for _, raw in frames)
+    pub = collector.StreamPublisher("bench:trade", args.batch, args.linger_ms,
+                                    encode=collector.encode_trades if args.format == "packed" else None)
+    published, lat = 0, []
+    def on_flush(n, age):
+        nonlocal published
+        published += n; lat.append(age)
+    pub.on_flush = on_flush
+
+    async with replay_ws.websockets.serve(replay_ws.make_handler(frames, args.speed), "127.0.0.1", args.port, compression=None):
+        tasks = [asyncio.create_task(pub.run()),
+                 asyncio.create_task(collector.ws_supervisor("bench", url, [], lambda raw: parse(raw, syms), pub))]
+        t0 = time.perf_counter()
+        while published < expected and time.perf_counter() - t0 < args.timeout:
+            await asyncio.sleep(0.01)
+        dt = time.perf_counter() - t0
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"{len(frames)} frames / {published} trades in {dt:.2f}s: {len(frames)/dt:,.0f} msgs/s, {published/dt:,.0f} trades/s")
+    print(f"{len(lat)} pipeline flushes, publish latency p50 {pct(lat, .5)*1000:.1f} ms  p99 {pct(lat, .99)*1000:.1f} ms")
+    await rds.redis_client.delete("bench:trade")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--exchange", choices=("binance", "bybit"), default="binance")
+    ap.add_argument("--frames", type=int, default=50_000, help="synthetic frames when no --frames-file")
+    ap.add_argument("--frames-file")
+    ap.add_argument("--speed", type=float, default=0, help="replay speed; 0 = as fast as possible")
+    ap.add_argument("--redis", help="Redis URL; fakeredis when omitted")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--format", choices=("packed", "legacy"), default="packed")
+    ap.add_argument("--linger-ms", type=int, default=50)
+    ap.add_argument("--timeout", type=float, default=120)
+    asyncio.run(run(ap.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Cost of finding what bina_VL still has to fetch: the original per-timestamp scan vs the coverage index.
+
+    python bench/bench_gaps.py --days 90 --tf 5m --holes 20
+
+The legacy path loads every cached candle of the window, builds the expected date_range and checks
+each timestamp against a set; `ohlcv_store.uncovered` only reads the symbol's coverage intervals.
+"""
+import argparse, random, statistics, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from ohlcv_store import ensure_db, save_ohlcv, load_ohlcv, add_coverage, load_coverage, uncovered, parse_tf  # noqa: E402
+
+EX, SYM = "binance", "BTC/USDT"
+
+def legacy_gaps(con, since_ms, until_ms, tf_ms):
+    """bina_VL before the coverage index: missing timestamps grouped into contiguous blocks."""
+    local = load_ohlcv(con, EX, SYM, since_ms, until_ms)
+    want = pd.date_range(pd.to_datetime(since_ms, unit="ms", utc=True), pd.to_datetime(until_ms, unit="ms", utc=True),
+                         freq=pd.Timedelta(milliseconds=tf_ms))
+    have = set(local["timestamp"]) if not local.empty else set()
+    miss = [t for t in want if t not in have]
+    blocks, cur = [], []
+    for t in miss:
+        if not cur or (t - cur[-1]).total_seconds() * 1000 == tf_ms:
+            cur.append(t)
+        else:
+            blocks.append(cur); cur = [t]
+    if cur:
+        blocks.append(cur)
+    return [(int(b[0].value // 10**6), int(b[-1].value // 10**6) + tf_ms) for b in blocks]
+
+def coverage_gaps(con, since_ms, until_ms, tf, tf_ms):
+    return uncovered(load_coverage(con, EX, SYM, tf), since_ms // tf_ms * tf_ms, until_ms)
+
+def build(path, days, tf, holes):
+    """`days` of candles ending now, with `holes` random gaps of 1-12 candles, and matching coverage rows."""
+    con = ensure_db(path)
+    tf_ms = parse_tf(tf)
+    end = int(time.time() * 1000) // tf_ms * tf_ms
+    ts = np.arange(end - days * 86_400_000, end, tf_ms)
+    keep = np.ones(len(ts), bool)
+    for start in random.sample(range(len(ts) - 12), holes):
+        keep[start:start + random.randint(1, 12)] = False
+    ts = ts[keep]
+    px = 60_000 + np.random.randn(len(ts)).cumsum()
+    save_ohlcv(con, EX, SYM, pd.DataFrame({"timestamp": ts, "open": px, "high": px + 5, "low": px - 5, "close": px,
+                                            "volume": np.random.rand(len(ts))}))
+    runs = np.flatnonzero(np.diff(ts) != tf_ms)
+    starts, stops = np.r_[0, runs + 1], np.r_[runs, len(ts) - 1]
+    for a, b in zip(starts, stops):
+        add_coverage(con, EX, SYM, tf, int(ts[a]), int(ts[b]) + tf_ms)
+    return con, end
+
+def timeit(fn, reps):
+    out = []
+    for _ in range(reps):
+        t = time.perf_counter(); res = fn(); out.append(time.perf_counter() - t)
+    return statistics.median(out), res
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--tf", default="5m")
+    ap.add_argument("--holes", type=int, default=20)
+    ap.add_argument("--reps", type=int, default=5)
+    args = ap.parse_args()
+    tf_ms = parse_tf(args.tf)
+    with tempfile.TemporaryDirectory() as tmp:
+        con, end = build(Path(tmp) / "ohlcv.db", args.days, args.tf, args.holes)
+        since = end - args.days * 86_400_000
+        t_old, old = timeit(lambda: legacy_gaps(con, since, end - tf_ms, tf_ms), args.reps)
+        t_new, new = timeit(lambda: coverage_gaps(con, since, end, args.tf, tf_ms), args.reps)
+    n = args.days * 86_400_000 // tf_ms
+    print(f"{n:,} candles ({args.days}d of {args.tf}), {args.holes} holes")
+    print(f"legacy scan    {t_old * 1000:9.2f} ms  {len(old)} gaps")
+    print(f"coverage index {t_new * 1000:9.2f} ms  {len(new)} gaps  ({t_old / t_new:,.0f}x)")
+    if old != new:
+        print("gap lists differ:", old[:3], new[:3])
+
+if __name__ == "__main__":
+    main()
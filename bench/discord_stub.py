@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Local stand-in for a Discord webhook, and a demo of notifier.Notifier against it.
+
+    python bench/discord_stub.py serve --port 8799 --rate-limit-every 4 --latency-ms 300
+    python bench/discord_stub.py demo --updates 50 --keys 5 --rate-limit-every 4 --latency-ms 300
+
+The stub accepts multipart posts, counts attachments, and answers every Nth request with
+429 {"retry_after": ...} the way Discord does. `demo` starts it in-process, fires updates at
+a Notifier faster than the stub accepts them and reports what was coalesced or superseded.
+"""
+import argparse, json, sys, tempfile, threading, time
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+class Stub(ThreadingHTTPServer):
+    def __init__(self, addr, rate_limit_every=0, retry_after=0.2, latency=0.0):
+        super().__init__(addr, Handler)
+        self.rate_limit_every, self.retry_after, self.latency = rate_limit_every, retry_after, latency
+        self.lock = threading.Lock(); self.requests = 0; self.messages = []
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        srv = self.server
+        with srv.lock:
+            srv.requests += 1; n = srv.requests
+        time.sleep(srv.latency)
+        if srv.rate_limit_every and n % srv.rate_limit_every == 0:
+            return self._reply(429, {"message": "You are being rate limited.", "retry_after": srv.retry_after, "global": False})
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        msg = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        parts = list(msg.iter_parts()) if msg.is_multipart() else []
+        files = [p.get_filename() for p in parts if p.get_param("name", header="content-disposition", failobj="").startswith("files[")]
+        content = next((p.get_content() for p in parts if p.get_param("name", header="content-disposition") == "content"),
+                       parse_qs(body.decode()).get("content", [""])[0] if not parts else "")
+        with srv.lock:
+            srv.messages.append({"content": content, "files": files})
+        self._reply(200, {"id": str(n)})
+
+    def _reply(self, code, body):
+        raw = json.dumps(body).encode()
+        self.send_response(code); self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw))); self.end_headers(); self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+def demo(args):
+    from notifier import Notifier
+    srv = Stub(("127.0.0.1", args.port), args.rate_limit_every, args.retry_after, args.latency_ms / 1000)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    tmp = Path(tempfile.mkdtemp())
+    imgs = []
+    for k in range(args.keys):
+        (tmp / f"chart{k}.png").write_bytes(b"\x89PNG" + bytes(args.image_kb * 1024)); imgs.append(tmp / f"chart{k}.png")
+    n = Notifier(f"http://127.0.0.1:{args.port}/api/webhooks/1/x")
+    t0 = time.perf_counter(); enqueue = []
+    for i in range(args.updates):
+        k = i % args.keys
+        t = time.perf_counter(); n.notify(f"update {i} for key {k}", [imgs[k]], key=k); enqueue.append(time.perf_counter() - t)
+        time.sleep(args.interval_ms / 1000)
+    n.flush(); dt = time.perf_counter() - t0; n.close(); srv.shutdown()
+    files = sum(len(m["files"]) for m in srv.messages)
+    print(f"{args.updates} updates -> {len(srv.messages)} messages / {files} files in {dt:.2f}s over {srv.requests} requests")
+    print(f"stats {n.stats}; max enqueue {max(enqueue)*1000:.2f} ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("cmd", choices=("serve", "demo"))
+    ap.add_argument("--port", type=int, default=8799)
+    ap.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429; 0 = never")
+    ap.add_argument("--retry-after", type=float, default=0.2)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--updates", type=int, default=50)
+    ap.add_argument("--keys", type=int, default=5)
+    ap.add_argument("--interval-ms", type=float, default=10, help="gap between demo updates")
+    ap.add_argument("--image-kb", type=int, default=150)
+    args = ap.parse_args()
+    if args.cmd == "demo":
+        demo(args)
+    else:
+        srv = Stub(("127.0.0.1", args.port), args.rate_limit_every, args.retry_after, args.latency_ms / 1000)
+        print(f"webhook stand-in on http://127.0.0.1:{args.port}/"); srv.serve_forever()
+
+if __name__ == "__main__":
+    main()
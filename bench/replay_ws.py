@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Local WebSocket stand-in that replays recorded exchange frames.
+
+    # capture a minute of real frames (one JSON line per frame: {"t": sec since start, "raw": frame})
+    python bench/replay_ws.py record --url 'wss://fstream.binance.com/stream?streams=btcusdt@aggTrade' --seconds 60 --out frames.jsonl
+    # or synthesise them
+    python bench/replay_ws.py synth --exchange bybit --frames 100000 --out frames.jsonl
+    # serve to every client that connects; --speed 0 sends as fast as the socket takes them
+    python bench/replay_ws.py serve --frames-file frames.jsonl --port 8765 --speed 1
+
+Incoming messages (subscriptions, pings) are read and ignored.
+"""
+import argparse, asyncio, json, random, time
+import websockets
+
+def load_frames(path:str) -> list:
+    with open(path) as fh:
+        return [(rec["t"], rec["raw"]) for rec in map(json.loads, fh)]
+
+def synth_frames(exchange:str, n:int, rate:float=2_000, symbol:str="BTCUSDT") -> list:
+    """Bursty BTC perp-ish trade frames: clustered arrivals, random-walk price, exponential sizes."""
+    out, t, px = [], 0.0, 60_000.0
+    t0_ms = int(time.time() * 1000)
+    for i in range(n):
+        t += random.expovariate(rate * (8 if random.random() < 0.1 else 1))
+        px += random.gauss(0, 0.5)
+        ts = t0_ms + int(t * 1000)
+        if exchange == "binance":
+            raw = {"stream": f"{symbol.lower()}@aggTrade", "data": {
+                "e": "aggTrade", "E": ts, "s": symbol, "a": i, "p": f"{px:.1f}", "q": f"{random.expovariate(20):.3f}",
+                "f": i, "l": i, "T": ts, "m": random.random() < 0.5}}
+        else:
+            k = 1 + int(random.expovariate(0.5))
+            raw = {"topic": f"publicTrade.{symbol}", "type": "snapshot", "ts": ts, "data": [
+                {"T": ts, "s": symbol, "S": random.choice(("Buy", "Sell")), "v": f"{random.expovariate(20):.3f}",
+                 "p": f"{px:.1f}", "L": "PlusTick", "i": f"{i}-{j}", "BT": False} for j in range(k)]}
+        out.append((t, json.dumps(raw, separators=(",", ":"))))
+    return out
+
+async def record(url:str, seconds:float, out:str, subscribe:str | None):
+    async with websockets.connect(url, max_size=2 ** 22) as ws:
+        if subscribe:
+            await ws.send(subscribe)
+        t0 = time.monotonic(); n = 0
+        with open(out, "w") as fh:
+            while time.monotonic() - t0 < seconds:
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), seconds - (time.monotonic() - t0))
+                except asyncio.TimeoutError:
+                    break
+                fh.write(json.dumps({"t": time.monotonic() - t0, "raw": raw}) + "\n"); n += 1
+    print(f"recorded {n} frames to {out}")
+
+def make_handler(frames:list, speed:float, loops:int=1):
+    async def handler(ws):
+        async def drain():
+            async for _ in ws:
+                pass
+        reader = asyncio.create_task(drain())
+        try:
+            for _ in range(loops):
+                start = time.monotonic()
+                for t, raw in frames:
+                    if speed > 0:
+                        delay = t / speed - (time.monotonic() - start)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    await ws.send(raw)
+        except websockets.ConnectionClosed:
+            pass  # client went away mid-replay
+        finally:
+            reader.cancel()
+    return handler
+
+async def serve(frames:list, host:str, port:int, speed:float, loops:int):
+    async with websockets.serve(make_handler(frames, speed, loops), host, port, compression=None, max_size=2 ** 22):
+        print(f"replaying {len(frames)} frames on ws://{host}:{port}")
+        await asyncio.Future()
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("record"); r.add_argument("--url", required=True); r.add_argument("--seconds", type=float, default=60)
+    r.add_argument("--subscribe", help="raw JSON message to send after connecting"); r.add_argument("--out", required=True)
+    s = sub.add_parser("synth"); s.add_argument("--exchange", choices=("binance", "bybit"), default="binance")
+    s.add_argument("--frames", type=int, default=100_000); s.add_argument("--rate", type=float, default=2_000); s.add_argument("--out", required=True)
+    v = sub.add_parser("serve"); v.add_argument("--frames-file", required=True); v.add_argument("--host", default="127.0.0.1")
+    v.add_argument("--port", type=int, default=8765); v.add_argument("--speed", type=float, default=1.0); v.add_argument("--loops", type=int, default=1)
+    args = ap.parse_args()
+    if args.cmd == "record":
+        asyncio.run(record(args.url, args.seconds, args.out, args.subscribe))
+    elif args.cmd == "synth":
+        with open(args.out, "w") as fh:
+            for t, raw in synth_frames(args.exchange, args.frames, args.rate):
+                fh.write(json.dumps({"t": t, "raw": raw}) + "\n")
+    else:
+        asyncio.run(serve(load_frames(args.frames_file), args.host, args.port, args.speed, args.loops))
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,34 @@
 """
 取引所別チャート（価格＋出来高スタック）。
 出来高カラーは **オリジナル版のシンボル配色** に合わせました。
+
+Startup is kept off the first fetch's critical path: exchange market metadata is hydrated from an
+on-disk cache (MARKETS_CACHE_HOURS TTL) and only expired entries are downloaded, concurrently;
+ccxt is imported inside `main()` and the charting stack (matplotlib, render pool) at the first render.
+pandas/numpy are imported where frames are built, and warmed on a background thread by `main()` so
+the import overlaps the market setup instead of delaying the first page.
 """
-import logging, os, time, datetime as dt
+import json, logging, os, time, datetime as dt, threading
+_T0=time.perf_counter()  # process start, for the time-to-first-fetch log
 from pathlib import Path
-import sqlite3, configparser, requests
-from typing import Dict, List
-import ccxt  # type: ignore
-import pandas as pd, numpy as np
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt, matplotlib.dates as mdates
+from concurrent.futures import ThreadPoolExecutor
+import configparser
+from typing import TYPE_CHECKING, Dict, List, Optional
+from ohlcv_store import (ensure_db, load_ohlcv_many, save_ohlcv, reader_con, parse_tf, SQLiteWriter,
+                         load_coverage, add_coverage, uncovered, OHLCVArchive, sync_archive)
+from notifier import Notifier
+from orderflow.utils import metrics
+if TYPE_CHECKING:
+    import ccxt  # type: ignore  # imported for real in setup_exchange / main
+    import pandas as pd
 
 ###############################################################################
 # CONFIG
 ###############################################################################
 CONFIG_FILE = Path("config.ini")
 DB_FILE     = Path(os.getenv("OHLCV_DB_PATH", Path.home()/".cache/bina_VL/ohlcv.db"))
+ARCHIVE_DIR = Path(os.getenv("OHLCV_ARCHIVE_PATH", DB_FILE.parent/"archive"))
+MARKETS_DIR = Path(os.getenv("MARKETS_CACHE_PATH", DB_FILE.parent/"markets"))
 CHART_DIR   = Path(os.getenv("CHART_SAVE_PATH",  Path.home()/"bina_VL_charts"))
 DEFAULTS    = {
     "API_KEY": "YOUR_BINANCE_API_KEY_PLACEHOLDER",
@@ -27,86 +39,144 @@ DEFAULTS    = {
     "CHART_PERIOD_DAYS": "1",
     "UPDATE_INTERVAL_SECONDS": "300",
     "FETCH_LIMIT": "1000",
+    "FETCH_WORKERS": "8",
+    "RENDER_WORKERS": "0",
+    "METRICS_PORT": "0",
+    "METRICS_LOG_SECONDS": "0",
+    "MARKETS_CACHE_HOURS": "24",
 }
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=LOG_LEVEL, format="%(asctime)sZ - %(levelname)s - %(message)s", datefmt="%Y-%m-%dT%H:%M:%S", force=True)
 logging.Formatter.converter = time.gmtime
 
-###############################################################################
-# DB helpers
-###############################################################################
-
-def ensure_db(path: Path) -> sqlite3.Connection:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(str(path))
-    con.execute("""CREATE TABLE IF NOT EXISTS ohlcv (
-        exchange TEXT, symbol TEXT, timestamp INTEGER,
-        open REAL, high REAL, low REAL, close REAL, volume REAL,
-        PRIMARY KEY(exchange,symbol,timestamp))""")
-    con.commit(); return con
-
-def save_ohlcv(con: sqlite3.Connection, ex: str, sym: str, df: pd.DataFrame):
-    if df.empty: return
-    df=df.copy(); df["exchange"]=ex; df["symbol"]=sym
-    df=df[["exchange","symbol","timestamp","open","high","low","close","volume"]]
-    df.to_sql("ohlcv", con, if_exists="append", index=False, method="multi")
-
-def load_ohlcv(con: sqlite3.Connection, ex: str, sym: str, since: int, until: int) -> pd.DataFrame:
-    sql="SELECT timestamp,open,high,low,close,volume FROM ohlcv WHERE exchange=? AND symbol=? AND timestamp BETWEEN ? AND ? ORDER BY timestamp"
-    df=pd.read_sql(sql, con, params=(ex,sym,since,until))
-    if not df.empty:
-        df["timestamp"]=pd.to_datetime(df["timestamp"],unit="ms",utc=True)
-    return df
+FETCH_TIME  =metrics.histogram("bina_fetch_ohlcv_seconds","ex.fetch_ohlcv round trip",("exchange",))
+FETCH_ERR   =metrics.counter("bina_fetch_errors","failed fetch_ohlcv calls",("exchange",))
+CANDLES     =metrics.counter("bina_candles_fetched","closed candles fetched and cached",("exchange",))
+CYCLE_TIME  =metrics.histogram("bina_cycle_seconds","cycle phase duration",("phase",))
+CHARTS      =metrics.counter("bina_charts","charts per cycle by outcome",("outcome",))
+DISCORD_TIME=metrics.histogram("bina_discord_post_seconds","webhook POST round trip",("status",))
+STARTUP     =metrics.gauge("bina_startup_seconds","seconds from process start to the end of each startup phase",("phase",))
 
 ###############################################################################
 # EXCHANGE util
 ###############################################################################
 
-def setup_exchange(name:str, api_key:str="", api_secret:str="")->ccxt.Exchange:
-    cls=getattr(ccxt,name); ex=cls({"enableRateLimit":True})
+class TokenBucket:
+    """Thread-safe per-exchange request limiter: `rate` calls/s with bursts of `burst`."""
+    def __init__(self, rate: float, burst: int=2):
+        self.rate=rate; self.burst=burst; self.tokens=float(burst); self.at=time.monotonic(); self.lock=threading.Lock()
+    def acquire(self):
+        with self.lock:
+            while True:
+                now=time.monotonic(); self.tokens=min(self.burst,self.tokens+(now-self.at)*self.rate); self.at=now
+                if self.tokens>=1: self.tokens-=1; return
+                time.sleep((1-self.tokens)/self.rate)
+
+LIMITERS: Dict[str,TokenBucket]={}  # exchange id => limiter, filled by main()
+
+def load_cached_markets(ex, cache_dir: Path, ttl_sec: float, stale_ok: bool=False) -> Optional[float]:
+    """Hydrate `ex` from its cached market metadata via `set_markets`; returns the cache age in seconds,
+    or None if there is no usable entry (missing, unreadable, or older than `ttl_sec` unless `stale_ok`)."""
+    path=cache_dir/f"{ex.id}.json"
+    try:
+        age=time.time()-path.stat().st_mtime
+        if age>ttl_sec and not stale_ok: return None
+        doc=json.loads(path.read_text())
+        ex.set_markets(doc["markets"],doc.get("currencies") or None)
+        return age
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if path.exists(): logging.warning("markets cache %s unusable: %s",path.name,e)
+        return None
+
+def save_cached_markets(ex, cache_dir: Path):
+    cache_dir.mkdir(parents=True,exist_ok=True)
+    path=cache_dir/f"{ex.id}.json"; tmp=path.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps({"markets":ex.markets,"currencies":ex.currencies},default=str)); os.replace(tmp,path)
+    except (OSError, TypeError, ValueError) as e:
+        logging.warning("markets cache %s not written: %s",path.name,e)
+
+def setup_exchange(name:str, api_key:str="", api_secret:str="", cache_dir: Optional[Path]=None, ttl_sec: float=0)->"ccxt.Exchange":
+    """ccxt client with its markets loaded: from `cache_dir` while younger than `ttl_sec`, otherwise downloaded
+    (and cached). A failed download falls back to an expired cache entry rather than failing startup."""
+    import ccxt  # type: ignore
+    # requests are paced by a TokenBucket per exchange (see LIMITERS), not ccxt's per-call sleep
+    cls=getattr(ccxt,name); ex=cls({"enableRateLimit":False})
     if name=="binance" and api_key and "PLACEHOLDER" not in api_key:
         ex.apiKey=api_key; ex.secret=api_secret
-    ex.load_markets(); return ex
+    if cache_dir is None: ex.load_markets(); return ex
+    age=load_cached_markets(ex,cache_dir,ttl_sec)
+    if age is not None:
+        logging.info("[%s] markets from cache (%.1fh old)",ex.id,age/3600); return ex
+    t=time.perf_counter()
+    try: ex.load_markets()
+    except Exception as e:
+        age=load_cached_markets(ex,cache_dir,ttl_sec,stale_ok=True)
+        if age is None: raise
+        logging.warning("[%s] load_markets failed (%s); using %.1fh-old cache",ex.id,e,age/3600); return ex
+    logging.info("[%s] markets loaded in %.1fs",ex.id,time.perf_counter()-t)
+    save_cached_markets(ex,cache_dir); return ex
 
-def parse_tf(tf:str)->int:
-    units={"m":60_000,"h":3_600_000,"d":86_400_000}
-    try: val, suf=int(tf[:-1]), tf[-1]; return val*units[suf]
-    except Exception: return 300_000
+def setup_exchanges(names: List[str], api_key: str, api_secret: str, cache_dir: Path, ttl_sec: float) -> Dict[str,object]:
+    """`setup_exchange` for every name at once: cache hits return immediately, expired ones download in parallel.
+    An exchange that cannot be set up at all is logged and mapped to None (skipped by the cycle)."""
+    with ThreadPoolExecutor(max_workers=len(names),thread_name_prefix="markets") as pool:
+        futs={n:pool.submit(setup_exchange,n,api_key,api_secret,cache_dir,ttl_sec) for n in names}
+    out={}
+    for n,fut in futs.items():
+        try: out[n]=fut.result()
+        except Exception as e: logging.error("[%s] setup failed: %s",n,e); out[n]=None
+    return out
 
 ###############################################################################
 # FETCH with cache
 ###############################################################################
 
-def fetch_and_cache_ohlcv(con, ex, sym, since_ms, until_ms, tf, limit):
-    tf_ms=parse_tf(tf)
-    local=load_ohlcv(con, ex.id, sym, since_ms, until_ms)
-    want=pd.date_range(pd.to_datetime(since_ms,unit="ms",utc=True), pd.to_datetime(until_ms,unit="ms",utc=True), freq=pd.Timedelta(milliseconds=tf_ms))
-    have=set(local["timestamp"]) if not local.empty else set()
-    miss=[t for t in want if t not in have]
-    if miss:
-        logging.info("[%s] %s missing %d – fetching", ex.id, sym, len(miss))
-        blocks, cur=[],[]
-        for t in miss:
-            if not cur or (t-cur[-1]).total_seconds()*1000==tf_ms: cur.append(t)
-            else: blocks.append(cur); cur=[t]
-        if cur: blocks.append(cur)
-        for blk in blocks:
-            cursor=int(blk[0].value//1e6); until_blk=int(blk[-1].value//1e6)
-            while cursor<=until_blk:
-                try:
-                    raw=ex.fetch_ohlcv(sym,timeframe=tf,since=cursor,limit=limit)
-                    if not raw: break
-                    df=pd.DataFrame(raw,columns=["timestamp","open","high","low","close","volume"])
-                    save_ohlcv(con,ex.id,sym,df)
-                    cursor=int(df["timestamp"].max())+tf_ms
-                    time.sleep(max(ex.rateLimit/1000,0.5))
-                except Exception as e:
-                    logging.error("fetch error %s",e); break
-    return load_ohlcv(con, ex.id, sym, since_ms, until_ms)
+def fetch_and_cache_ohlcv(con, ex, sym, since_ms, until_ms, tf, limit, limiter=None, write=None):
+    """Fetch only what the coverage index says is missing: normally just the tail since the last closed candle.
+    Writes are callables on a connection, run through `write` (e.g. SQLiteWriter.submit) or directly on `con`.
+    Returns candles fetched."""
+    tf_ms=parse_tf(tf); limiter=limiter or LIMITERS[ex.id]; write=write or (lambda fn: fn(con)); got=0
+    closed_end=until_ms//tf_ms*tf_ms  # open time of the still-forming candle: neither cached nor covered
+    gaps=uncovered(load_coverage(con,ex.id,sym,tf), since_ms//tf_ms*tf_ms, closed_end)
+    if gaps:
+        logging.info("[%s] %s missing %d – fetching", ex.id, sym, sum((e-s)//tf_ms for s,e in gaps))
+    for start,end in gaps:
+        cursor=start
+        while cursor<end:
+            try:
+                limiter.acquire()
+                with FETCH_TIME.time(exchange=ex.id): raw=ex.fetch_ohlcv(sym,timeframe=tf,since=cursor,limit=limit)
+                if not raw:
+                    # nothing from cursor on: remember it as empty, except the newest closed candle which may just be late
+                    write(lambda c,a=cursor,b=min(end,closed_end-tf_ms): add_coverage(c,ex.id,sym,tf,a,b)); break
+                import pandas as pd  # loaded already by main()'s warm-up thread, or waits for it
+                df=pd.DataFrame(raw,columns=["timestamp","open","high","low","close","volume"])
+                last=int(df["timestamp"].max())
+                if last<cursor: break
+                df=df[df["timestamp"]<closed_end]  # the forming candle is refetched next cycle, never cached half-built
+                write(lambda c,df=df: save_ohlcv(c,ex.id,sym,df))
+                write(lambda c,a=cursor,b=min(last+tf_ms,closed_end): add_coverage(c,ex.id,sym,tf,a,b))
+                got+=len(df); cursor=last+tf_ms; CANDLES.inc(len(df),exchange=ex.id)
+            except Exception as e:
+                FETCH_ERR.inc(exchange=ex.id); logging.error("fetch error %s",e); break
+    return got
 
 def fetch_and_cache_all(con, ex, syms, since_ms, until_ms, tf, limit):
     for s in syms: fetch_and_cache_ohlcv(con, ex, s, since_ms, until_ms, tf, limit)
 
+def fetch_parallel(jobs, since_ms, until_ms, tf, limit, workers, writer):
+    """Fetch every (exchange, symbol) job concurrently; per-exchange TokenBuckets keep each venue within its limit,
+    so wall time tracks the slowest exchange instead of the sum. Returns once every page is committed."""
+    def one(ex, sym):
+        t=time.time(); n=fetch_and_cache_ohlcv(reader_con(DB_FILE),ex,sym,since_ms,until_ms,tf,limit,write=writer.submit)
+        return ex.id,sym,n,time.time()-t
+    with ThreadPoolExecutor(max_workers=workers,thread_name_prefix="fetch") as pool:
+        for fut in [pool.submit(one,ex,sym) for ex,sym in jobs]:
+            try: ex_id,sym,n,sec=fut.result(); logging.debug("[%s] %s +%d in %.1fs",ex_id,sym,n,sec)
+            except Exception as e: logging.error("fetch job failed %s",e)
+    writer.wait()
+
 ###############################################################################
 # COLOR mapping (original)
 ###############################################################################
@@ -130,39 +200,25 @@ DEFAULT_VOL_COLOR="#888888"
 ###############################################################################
 # CHARTING
 ###############################################################################
-plt.style.use("dark_background")
-
 def get_color(ex_id:str, sym:str)->str:
     key=f"{sym}_{ex_id}" if f"{sym}_{ex_id}" in SYMBOL_COLOR else sym
     return SYMBOL_COLOR.get(key, DEFAULT_VOL_COLOR)
 
-def generate_chart(ex_id:str, price_df:pd.DataFrame, price_sym:str, vol_map:Dict[str,pd.DataFrame], tf_ms:int, out:Path):
-    if price_df.empty:
-        logging.warning("%s no price", ex_id); return
-    bar_w=(tf_ms/86_400_000)*0.9
-    fig,(axp,axv)=plt.subplots(2,1,figsize=(14,6),sharex=True,gridspec_kw={"height_ratios":[2,1],"hspace":0.15})
-    fig.patch.set_facecolor("#000000"); fig.suptitle(f"{ex_id.capitalize()} – {price_sym} Price & Volume",color="w",fontsize=18)
-    axp.plot(price_df["timestamp"],price_df["close"],lw=1.5,color="#47aaff",label=price_sym)
-    axp.grid(ls=":",alpha=0.3); axp.tick_params(axis="y",colors="#ccc"); axp.yaxis.tick_right(); axp.set_ylabel("Price",color="#ccc"); axp.legend(loc="upper left")
-    bottom=np.zeros(len(price_df))
-    for sym,vdf in vol_map.items():
-        ser=vdf.set_index("timestamp")["volume"].reindex(price_df["timestamp"]).fillna(0)
-        axv.bar(price_df["timestamp"],ser,bottom=bottom,width=bar_w,color=get_color(ex_id,sym),label=sym)
-        bottom+=ser.values
-    axv.set_ylabel("Volume",color="#ccc"); axv.grid(ls=":",alpha=0.3); axv.tick_params(axis="y",colors="#ccc"); axv.yaxis.tick_right(); axv.legend(loc="upper left",fontsize=9,ncol=2)
-    loc=mdates.AutoDateLocator(minticks=5,maxticks=10); axv.xaxis.set_major_locator(loc); axv.xaxis.set_major_formatter(mdates.ConciseDateFormatter(loc)); fig.autofmt_xdate()
-    fig.tight_layout(rect=[0,0,1,0.95]); out.parent.mkdir(parents=True,exist_ok=True); fig.savefig(out,dpi=150,bbox_inches="tight",facecolor=fig.get_facecolor()); plt.close(fig); logging.info("saved %s",out)
-
-###############################################################################
-# DISCORD
-###############################################################################
-
-def discord_notify(webhook:str, path:Path, msg:str=""):
-    if not webhook or not path.exists(): return
-    try:
-        with path.open("rb") as fh:
-            r=requests.post(webhook,data={"content":msg},files={"file":(path.name,fh,"image/png")}); r.raise_for_status(); logging.info("discord ok")
-    except Exception as e: logging.error("discord fail %s",e)
+def chart_job(ex_id:str, frame:"pd.DataFrame", price_sym:str, syms:List[str], tf_ms:int, out:Path):
+    """One exchange's price + stacked volume chart as a RenderStage job; None when the price series is empty.
+    Volumes are aligned to the price timestamps with a single pivot, the arrays are what the job hashes on."""
+    import numpy as np
+    from charts import draw_price_volume, stack_volumes, utc_ms  # matplotlib: first render only
+    price=frame[frame["symbol"]==price_sym]
+    if price.empty:
+        logging.warning("%s no price", ex_id); return None
+    present=set(frame["symbol"].unique())
+    if missing:=[s for s in syms if s not in present]:
+        logging.warning("%s no candles for %s", ex_id, ", ".join(missing)); syms=[s for s in syms if s in present]
+    vols=stack_volumes(frame,price["timestamp"],syms)
+    args=(f"{ex_id.capitalize()} – {price_sym} Price & Volume",utc_ms(price["timestamp"]),price["close"].to_numpy(np.float64),
+          price_sym,list(syms),[get_color(ex_id,s) for s in syms],vols,(tf_ms/86_400_000)*0.9)
+    return (out,draw_price_volume,args)
 
 ###############################################################################
 # MAIN
@@ -172,11 +228,7 @@ def ensure_config():
     if not CONFIG_FILE.exists():
         cp=configparser.ConfigParser(); cp["DEFAULT"]=DEFAULTS; CONFIG_FILE.write_text("\n".join(f"{k}={v}" for k,v in DEFAULTS.items()))
     cfg=configparser.ConfigParser(); cfg.read(CONFIG_FILE); [cfg["DEFAULT"].setdefault(k,v) for k,v in DEFAULTS.items()]; return cfg
-cfg=ensure_config(); TIMEFRAME=cfg.get("DEFAULT","TIMEFRAME"); TF_MS=parse_tf(TIMEFRAME); DAYS=cfg.getint("DEFAULT","CHART_PERIOD_DAYS"); UPDATE=cfg.getint("DEFAULT","UPDATE_INTERVAL_SECONDS"); LIMIT=cfg.getint("DEFAULT","FETCH_LIMIT")
-API_KEY=os.getenv("BINANCE_API_KEY",cfg.get("DEFAULT","API_KEY")); API_SECRET=os.getenv("BINANCE_API_SECRET",cfg.get("DEFAULT","API_SECRET")); WEBHOOK=os.getenv("DISCORD_WEBHOOK_URL",cfg.get("DEFAULT","DISCORD_WEBHOOK_URL"))
-con=ensure_db(DB_FILE)
-# exchanges
-binance=setup_exchange("binance",API_KEY,API_SECRET); coinbase=setup_exchange("coinbasepro") if hasattr(ccxt,"coinbasepro") else setup_exchange("coinbase"); bitstamp=setup_exchange("bitstamp"); kraken=setup_exchange("kraken")
+
 PAIR_MAP={
     "binance":["BTC/USDT","BTC/FDUSD","BTC/USDC","BTC/EUR"],
     "coinbasepro":["BTC/USD"],
@@ -184,22 +236,59 @@ PAIR_MAP={
     "bitstamp":["BTC/USD","BTC/EUR","BTC/GBP","BTC/USDT"],
     "kraken":["BTC/USD","BTC/EUR","BTC/GBP","BTC/USDT"],
 }
-EX_OBJ={"binance":binance,"coinbasepro":coinbase,"coinbase":coinbase,"bitstamp":bitstamp,"kraken":kraken}
 
 def repr_sym(lst):
     for p in ("BTC/USDT","BTC/USD",lst[0]):
         if p in lst: return p
     return lst[0]
 
-while True:
-    t0=time.time(); now=int(time.time()*1000); since=now-DAYS*86_400_000
-    for ex_id,syms in PAIR_MAP.items():
-        ex=EX_OBJ[ex_id];
-        if ex is None: continue
-        fetch_and_cache_all(con,ex,syms,since,now,TIMEFRAME,LIMIT)
-        price_sym=repr_sym(syms); price_df=load_ohlcv(con,ex_id,price_sym,since,now)
-        vol_map={s:load_ohlcv(con,ex_id,s,since,now)[["timestamp","volume"]] for s in syms}
-        img=CHART_DIR/f"{ex_id}_btc_volume.png"; generate_chart(ex_id,price_df,price_sym,vol_map,TF_MS,img)
-        if WEBHOOK: discord_notify(WEBHOOK,img,f"{ex_id.capitalize()} BTC update {dt.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
-    sl=max(UPDATE-(time.time()-t0),0); logging.info("sleep %.1fs",sl); time.sleep(sl)
+def main():
+    cfg=ensure_config(); TIMEFRAME=cfg.get("DEFAULT","TIMEFRAME"); TF_MS=parse_tf(TIMEFRAME); DAYS=cfg.getint("DEFAULT","CHART_PERIOD_DAYS"); UPDATE=cfg.getint("DEFAULT","UPDATE_INTERVAL_SECONDS"); LIMIT=cfg.getint("DEFAULT","FETCH_LIMIT"); WORKERS=cfg.getint("DEFAULT","FETCH_WORKERS")
+    API_KEY=os.getenv("BINANCE_API_KEY",cfg.get("DEFAULT","API_KEY")); API_SECRET=os.getenv("BINANCE_API_SECRET",cfg.get("DEFAULT","API_SECRET")); WEBHOOK=os.getenv("DISCORD_WEBHOOK_URL",cfg.get("DEFAULT","DISCORD_WEBHOOK_URL"))
+    metrics.start(cfg.getint("DEFAULT","METRICS_PORT"),cfg.getfloat("DEFAULT","METRICS_LOG_SECONDS"))
+    threading.Thread(target=__import__,args=("pandas",),name="import-pandas",daemon=True).start()  # needed from the first page on
+    con=ensure_db(DB_FILE)
+    # exchanges: markets from the on-disk cache where fresh, the rest downloaded concurrently
+    import ccxt  # type: ignore
+    t_import=time.perf_counter()-_T0
+    coinbase_id="coinbasepro" if hasattr(ccxt,"coinbasepro") else "coinbase"
+    clients=setup_exchanges(["binance",coinbase_id,"bitstamp","kraken"],API_KEY,API_SECRET,MARKETS_DIR,cfg.getfloat("DEFAULT","MARKETS_CACHE_HOURS")*3600)
+    EX_OBJ={"binance":clients["binance"],"coinbasepro":clients[coinbase_id],"coinbase":clients[coinbase_id],"bitstamp":clients["bitstamp"],"kraken":clients["kraken"]}
+    LIMITERS.update({e.id:TokenBucket(1000/max(e.rateLimit,1)) for e in EX_OBJ.values() if e is not None})
+    t_markets=time.perf_counter()-_T0; STARTUP.set(t_markets,phase="markets")
+    WRITER=SQLiteWriter(DB_FILE) if WORKERS>1 else None
+    NOTIFIER=Notifier(WEBHOOK) if WEBHOOK else None  # posts in the background; this cycle's charts go out as one message
+    if NOTIFIER: NOTIFIER.on_post=lambda sec,status: DISCORD_TIME.observe(sec,status=status or "error")
+    ARCHIVE=OHLCVArchive(ARCHIVE_DIR)  # closed, gap-free history as memmapped columns; SQLite keeps only the live tail hot
+    RENDER=None  # built at the first render, after the first fetch (its workers never fork this process)
+    first=True
+
+    while True:
+        t0=time.time(); now=int(time.time()*1000); since=now-DAYS*86_400_000
+        active={ex_id:syms for ex_id,syms in PAIR_MAP.items() if EX_OBJ[ex_id] is not None and EX_OBJ[ex_id].id==ex_id}
+        if WRITER: fetch_parallel([(EX_OBJ[e],s) for e,syms in active.items() for s in syms],since,now,TIMEFRAME,LIMIT,WORKERS,WRITER)
+        else:
+            for ex_id,syms in active.items(): fetch_and_cache_all(con,EX_OBJ[ex_id],syms,since,now,TIMEFRAME,LIMIT)
+        logging.info("fetch %.1fs",time.time()-t0); CYCLE_TIME.observe(time.time()-t0,phase="fetch")
+        if first:
+            ttff=time.perf_counter()-_T0; STARTUP.set(ttff,phase="first_fetch"); first=False
+            logging.info("startup: imports %.1fs, markets %.1fs, first fetch done %.1fs after start",t_import,t_markets-t_import,ttff)
+        for ex_id,syms in active.items():
+            for s in syms: sync_archive(con,ARCHIVE,ex_id,s,TIMEFRAME,since//TF_MS*TF_MS)  # holes before `since` are never refetched
+        jobs={}
+        for ex_id,syms in active.items():
+            frame=load_ohlcv_many(con,ex_id,syms,since,now,ARCHIVE,TIMEFRAME)  # archived span from memmaps, tail from SQLite
+            job=chart_job(ex_id,frame,repr_sym(syms),syms,TF_MS,CHART_DIR/f"{ex_id}_btc_volume.png")
+            if job: jobs[job[0]]=(ex_id,job)
+        if RENDER is None:
+            from charts import RenderStage
+            RENDER=RenderStage(cfg.getint("DEFAULT","RENDER_WORKERS"))
+        drawn=RENDER.render([job for _,job in jobs.values()])  # unchanged charts are neither redrawn nor reposted
+        CYCLE_TIME.observe(RENDER.last_sec,phase="render"); CHARTS.inc(len(drawn),outcome="drawn"); CHARTS.inc(len(jobs)-len(drawn),outcome="unchanged")
+        for img in drawn:
+            if NOTIFIER: NOTIFIER.notify(f"{jobs[img][0].capitalize()} BTC update {dt.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}",[img],key=jobs[img][0])
+        CYCLE_TIME.observe(time.time()-t0,phase="total")
+        sl=max(UPDATE-(time.time()-t0),0); logging.info("sleep %.1fs",sl); time.sleep(sl)
 
+if __name__=="__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Chart rendering stage shared by bina_VL and stablecoin_monitor.
+
+A chart is a job: a module-level draw function plus the plain arrays it plots. `RenderStage` hashes every job's
+inputs and skips charts whose inputs are unchanged since the file on disk was drawn; the rest are drawn in a
+process pool, so a cycle costs the slowest chart instead of the sum of all of them.
+"""
+import hashlib, logging, multiprocessing as mp, os, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt, matplotlib.dates as mdates
+
+Job=Tuple[Path, Callable, tuple]  # (out, draw, args): draw(out, *args)
+
+###############################################################################
+# Inputs
+###############################################################################
+
+def input_hash(*parts) -> str:
+    """Digest of arrays (dtype, shape and bytes), nested sequences and scalars; equal inputs draw equal charts."""
+    h=hashlib.blake2b(digest_size=16)
+    for p in parts:
+        if isinstance(p,np.ndarray): h.update(f"{p.dtype}{p.shape}".encode()); h.update(np.ascontiguousarray(p).tobytes())
+        elif isinstance(p,(list,tuple)): h.update(input_hash(*p).encode())
+        else: h.update(repr(p).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def utc_ms(ts: pd.Series) -> np.ndarray:
+    """UTC timestamps (tz-aware or naive) => naive datetime64[ms], which is what the draw functions take."""
+    if getattr(ts.dt,"tz",None) is not None: ts=ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    return ts.to_numpy().astype("datetime64[ms]")
+
+def stack_volumes(frame: pd.DataFrame, index: pd.Series, syms: Sequence[str]) -> np.ndarray:
+    """Long (symbol, timestamp, volume) rows => a len(syms) x len(index) matrix aligned to `index`, 0 where missing.
+
+    One pivot for every series instead of a reindex per symbol inside the plotting loop."""
+    wide=frame.pivot(index="timestamp",columns="symbol",values="volume").reindex(index=index,columns=list(syms))
+    return wide.fillna(0.0).to_numpy(np.float64).T
+
+###############################################################################
+# Draw functions (run in pool workers; module-level so they pickle by name)
+###############################################################################
+
+def draw_price_volume(out: Path, title: str, ts: np.ndarray, close: np.ndarray, price_sym: str,
+                      syms: List[str], colors: List[str], vols: np.ndarray, bar_w: float):
+    """bina_VL exchange chart: close price on top, per-symbol stacked volume bars below."""
+    with plt.style.context("dark_background"):
+        fig,(axp,axv)=plt.subplots(2,1,figsize=(14,6),sharex=True,gridspec_kw={"height_ratios":[2,1],"hspace":0.15})
+        fig.patch.set_facecolor("#000000"); fig.suptitle(title,color="w",fontsize=18)
+        axp.plot(ts,close,lw=1.5,color="#47aaff",label=price_sym)
+        axp.grid(ls=":",alpha=0.3); axp.tick_params(axis="y",colors="#ccc"); axp.yaxis.tick_right(); axp.set_ylabel("Price",color="#ccc"); axp.legend(loc="upper left")
+        bottoms=np.vstack([np.zeros(len(ts)),np.cumsum(vols,axis=0)[:-1]])
+        for sym,color,v,b in zip(syms,colors,vols,bottoms):
+            axv.bar(ts,v,bottom=b,width=bar_w,color=color,label=sym)
+        axv.set_ylabel("Volume",color="#ccc"); axv.grid(ls=":",alpha=0.3); axv.tick_params(axis="y",colors="#ccc"); axv.yaxis.tick_right(); axv.legend(loc="upper left",fontsize=9,ncol=2)
+        loc=mdates.AutoDateLocator(minticks=5,maxticks=10); axv.xaxis.set_major_locator(loc); axv.xaxis.set_major_formatter(mdates.ConciseDateFormatter(loc)); fig.autofmt_xdate()
+        fig.tight_layout(rect=[0,0,1,0.95]); out.parent.mkdir(parents=True,exist_ok=True)
+        fig.savefig(out,dpi=150,bbox_inches="tight",facecolor=fig.get_facecolor()); plt.close(fig)
+
+def draw_lines(out: Path, ts: np.ndarray, labels: List[str], top: np.ndarray, bottom: np.ndarray, titles: Tuple[str,str]):
+    """stablecoin_monitor chart: one line per label in each of two panels; NaN marks a missing sample."""
+    fig,axes=plt.subplots(2,1,figsize=(12,8))
+    for ax,mat,t in zip(axes,(top,bottom),titles):
+        for label,row in zip(labels,mat):
+            ok=~np.isnan(row); ax.plot(ts[ok],row[ok],label=label)
+        ax.set_title(t); ax.legend()
+    fig.autofmt_xdate(); fig.tight_layout(); out.parent.mkdir(parents=True,exist_ok=True)
+    fig.savefig(out); plt.close(fig)
+
+###############################################################################
+# Stage
+###############################################################################
+
+def _mp_context():
+    """forkserver where available: workers fork from a clean server process that imported this module once, so a
+    pool started after threads exist is safe and matplotlib is imported once, not per worker. Spawn elsewhere."""
+    if "forkserver" not in mp.get_all_start_methods(): return None
+    ctx=mp.get_context("forkserver"); ctx.set_forkserver_preload([__name__]); return ctx
+
+class RenderStage:
+    """Draws chart jobs, skipping those whose input hash matches the one that produced the file on disk.
+
+    With workers > 1 (0: one per CPU, at most 4) changed charts are drawn in a process pool, started from the constructor.
+    Workers never fork the caller (see `_mp_context`), so the stage can be built lazily, after other threads are running."""
+    def __init__(self, workers: int=0):
+        workers=workers or min(4,os.cpu_count() or 1)
+        self.hashes: Dict[Path,str]={}; self.last_sec=0.0
+        self.pool: Optional[ProcessPoolExecutor]=None
+        if workers>1:
+            self.pool=ProcessPoolExecutor(workers,mp_context=_mp_context())
+            self.pool.submit(int).result()  # start the workers now rather than inside the first render
+    def render(self, jobs: List[Job]) -> List[Path]:
+        """Draw what changed; returns the paths actually (re)drawn. Failures are logged and retried next call."""
+        t0=time.perf_counter(); todo=[]
+        for out,draw,args in jobs:
+            key=input_hash(draw.__module__,draw.__qualname__,str(out),*args)
+            if self.hashes.get(out)!=key or not out.exists(): todo.append((out,key,draw,args))
+        if self.pool and len(todo)>1:
+            runs=[(out,key,self.pool.submit(draw,out,*args).result) for out,key,draw,args in todo]
+        else:
+            runs=[(out,key,(lambda d=draw,o=out,a=args: d(o,*a))) for out,key,draw,args in todo]
+        done=[]
+        for out,key,result in runs:
+            try: result(); self.hashes[out]=key; done.append(out)
+            except Exception as e: self.hashes.pop(out,None); logging.error("render %s failed: %s",out.name,e)
+        self.last_sec=time.perf_counter()-t0
+        logging.info("render %.2fs: %d drawn, %d unchanged",self.last_sec,len(done),len(jobs)-len(todo))
+        return done
+    def close(self):
+        if self.pool: self.pool.shutdown(cancel_futures=True)
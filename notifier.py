@@ -0,0 +1,114 @@
+"""Discord webhook dispatcher shared by bina_VL and stablecoin_monitor.
+
+`notify()` only enqueues and returns; a single background thread posts over one keep-alive `requests.Session`.
+Queued updates are keyed (e.g. by exchange): a newer update for a key replaces the queued one, so a slow or
+rate-limited webhook delays the latest state instead of building a backlog. Everything queued when the worker
+wakes is coalesced into as few messages as Discord allows (10 attachments, 2000 characters each).
+HTTP 429 is retried after the advertised `retry_after`; errors and 5xx back off exponentially with jitter.
+"""
+import itertools, logging, random, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import requests
+
+MAX_FILES=10       # attachments per webhook message
+MAX_CONTENT=2000   # characters of message content
+
+class Notifier(threading.Thread):
+    """Background webhook poster. `url` and `session` are injectable so it can run against a local stand-in."""
+    def __init__(self, url: str, session: Optional[requests.Session]=None, maxsize: int=32, timeout: float=10,
+                 max_retries: int=5, backoff_max: float=60, linger: float=0.5):
+        super().__init__(daemon=True, name="notifier")
+        self.url=url; self.session=session or requests.Session(); self.timeout=timeout
+        self.maxsize=maxsize; self.max_retries=max_retries; self.backoff_max=backoff_max
+        self.linger=linger  # after the first update arrives, wait this long for the rest of the cycle's updates
+        self.pending: "OrderedDict[object,Tuple[str,List[Tuple[str,bytes]]]]"=OrderedDict()
+        self.cond=threading.Condition(); self.stopping=threading.Event(); self.busy=False
+        self.stats: Dict[str,int]={"queued":0,"superseded":0,"dropped":0,"messages":0,"rate_limited":0,"failed":0}
+        self.on_post=None  # optional callback(seconds, status code or None on a connection error) per HTTP attempt
+        self._seq=itertools.count(); self.start()
+
+    def notify(self, text: str, files: Sequence[Path]=(), key=None):
+        """Queue `text` with image `files` (read now, so a later redraw cannot change what is sent).
+        A queued update with the same `key` is replaced; without a key every update is kept."""
+        payload=[]
+        for p in files:
+            try: payload.append((Path(p).name,Path(p).read_bytes()))
+            except OSError as e: logging.error("notify: cannot read %s: %s",p,e)
+        with self.cond:
+            if key is None: key=("_",next(self._seq))
+            elif key in self.pending: self.stats["superseded"]+=1; del self.pending[key]
+            self.pending[key]=(text,payload); self.stats["queued"]+=1
+            while len(self.pending)>self.maxsize: self.pending.popitem(last=False); self.stats["dropped"]+=1
+            self.cond.notify()
+
+    def flush(self, timeout: Optional[float]=None) -> bool:
+        """Wait until everything queued so far has been posted (or given up on)."""
+        end=None if timeout is None else time.monotonic()+timeout
+        with self.cond:
+            while self.pending or self.busy:
+                left=None if end is None else end-time.monotonic()
+                if left is not None and left<=0: return False
+                self.cond.wait(left)
+        return True
+
+    def close(self, timeout: float=10):
+        self.flush(timeout); self.stopping.set()
+        with self.cond: self.cond.notify_all()
+        self.join(timeout); self.session.close()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.stopping.is_set(): self.cond.wait()
+                if self.stopping.is_set() and not self.pending: return
+            self.stopping.wait(self.linger)
+            with self.cond:
+                batch=list(self.pending.values()); self.pending.clear(); self.busy=True
+            try:
+                for text,files in self._coalesce(batch):
+                    if self._post(text,files): self.stats["messages"]+=1
+            finally:
+                with self.cond: self.busy=False; self.cond.notify_all()
+
+    @staticmethod
+    def _coalesce(batch):
+        """Updates => messages of at most MAX_FILES attachments and MAX_CONTENT characters, in queue order."""
+        msgs=[]; text=""; files=[]
+        for t,fs in batch:
+            if (text or files) and (len(files)+len(fs)>MAX_FILES or len(text)+1+len(t)>MAX_CONTENT):
+                msgs.append((text,files)); text,files="",[]
+            text=f"{text}\n{t}" if text else t; files=files+fs
+        if text or files: msgs.append((text,files))
+        return [(t[:MAX_CONTENT],fs) for t,fs in msgs]
+
+    def _post(self, text: str, files: List[Tuple[str,bytes]]) -> bool:
+        form={f"files[{i}]":(name,data,"image/png") for i,(name,data) in enumerate(files)}
+        for attempt in range(self.max_retries+1):
+            t=time.perf_counter(); status=None
+            try:
+                r=self.session.post(self.url,data={"content":text},files=form or None,timeout=self.timeout); status=r.status_code
+                if r.status_code==429:
+                    self.stats["rate_limited"]+=1; wait=self._retry_after(r)
+                elif r.status_code>=500:
+                    wait=None
+                else:
+                    r.raise_for_status(); logging.info("discord ok (%d files)",len(files)); return True
+            except requests.HTTPError as e:
+                logging.error("discord rejected message: %s",e); break  # 4xx other than 429: retrying will not help
+            except requests.RequestException as e:
+                logging.warning("discord post failed: %s",e); wait=None
+            finally:
+                if self.on_post: self.on_post(time.perf_counter()-t,status)
+            if attempt==self.max_retries: break
+            if wait is None: wait=min(self.backoff_max,2**attempt)*(0.5+random.random()/2)
+            if self.stopping.wait(wait): break
+        self.stats["failed"]+=1; logging.error("discord gave up on a message with %d files",len(files))
+        return False
+
+    def _retry_after(self, r) -> float:
+        try: return float(r.json()["retry_after"])
+        except (ValueError, KeyError, TypeError): pass
+        try: return float(r.headers.get("Retry-After",1))
+        except ValueError: return 1.0
@@ -0,0 +1,247 @@
+"""SQLite OHLCV cache for bina_VL: candles, the coverage index, and the single-writer thread.
+
+Connections run in WAL mode so fetch workers keep reading while the writer commits; candles are
+upserted (`INSERT OR REPLACE`) so overlapping pages never fail.
+
+Closed, fully covered history is additionally appended to an `OHLCVArchive`: one raw column file
+per field per (exchange, symbol, timeframe), memory-mapped and binary-searched on read, so long
+chart windows never go through SQLite rows or Python objects.
+
+numpy and pandas are imported by the functions that build or read frames, not at import time, so
+bina_VL can start its first fetch without them.
+"""
+import json, logging, os, sqlite3, threading, queue
+from itertools import repeat
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+if TYPE_CHECKING: import pandas as pd
+
+OHLCV_COLS=["timestamp","open","high","low","close","volume"]
+PRAGMAS=(
+    "PRAGMA journal_mode=WAL",       # readers never block on the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",     # fsync at checkpoints only; a cache can afford losing the last commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32768",      # 32 MiB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MiB of the file mapped for reads
+)
+
+def parse_tf(tf:str)->int:
+    units={"m":60_000,"h":3_600_000,"d":86_400_000}
+    try: val, suf=int(tf[:-1]), tf[-1]; return val*units[suf]
+    except Exception: return 300_000
+
+def connect(path: Path) -> sqlite3.Connection:
+    con=sqlite3.connect(str(path), timeout=30, cached_statements=256)
+    for p in PRAGMAS: con.execute(p)
+    return con
+
+def ensure_db(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    con = connect(path)
+    con.execute("""CREATE TABLE IF NOT EXISTS ohlcv (
+        exchange TEXT, symbol TEXT, timestamp INTEGER,
+        open REAL, high REAL, low REAL, close REAL, volume REAL,
+        PRIMARY KEY(exchange,symbol,timestamp))""")
+    # [start_ms, end_ms) ranges of candle open times already fetched (incl. ranges the exchange has no candles for)
+    con.execute("""CREATE TABLE IF NOT EXISTS ohlcv_coverage (
+        exchange TEXT, symbol TEXT, timeframe TEXT, start_ms INTEGER, end_ms INTEGER,
+        PRIMARY KEY(exchange,symbol,timeframe,start_ms))""")
+    con.commit(); return con
+
+def save_ohlcv(con: sqlite3.Connection, ex: str, sym: str, df: "pd.DataFrame"):
+    """Upsert a page of candles; rows already cached (overlapping pages, refetched candles) are replaced."""
+    if df.empty: return
+    rows=zip(repeat(ex), repeat(sym), *(df[c].tolist() for c in OHLCV_COLS))
+    with con:
+        con.executemany("INSERT OR REPLACE INTO ohlcv(exchange,symbol,timestamp,open,high,low,close,volume) VALUES(?,?,?,?,?,?,?,?)", rows)
+
+def _frame(rows, cols) -> "pd.DataFrame":
+    import pandas as pd
+    df=pd.DataFrame.from_records(rows, columns=cols)
+    if df.empty:  # typed like a non-empty frame, so concatenating an empty part never turns a column into object
+        df=df.astype({c:OHLCVArchive.DTYPES[c] for c in cols if c!="symbol"})
+    df["timestamp"]=pd.to_datetime(df["timestamp"],unit="ms",utc=True)
+    return df
+
+def load_ohlcv(con: sqlite3.Connection, ex: str, sym: str, since: int, until: int, archive: Optional["OHLCVArchive"]=None, tf: str="") -> "pd.DataFrame":
+    """Candles in [since, until]; with `archive`, the archived span comes from the memmap and only the rest from SQLite."""
+    sql="SELECT timestamp,open,high,low,close,volume FROM ohlcv WHERE exchange=? AND symbol=? AND timestamp BETWEEN ? AND ? ORDER BY timestamp"
+    if archive is None:
+        return _frame(con.execute(sql,(ex,sym,since,until)).fetchall(), OHLCV_COLS)
+    a_start,a_end=archive.span(ex,sym,tf)
+    if a_end<=since or a_start>until:
+        return load_ohlcv(con,ex,sym,since,until)
+    parts=[_frame(con.execute(sql,(ex,sym,since,a_start-1)).fetchall(),OHLCV_COLS)] if since<a_start else []
+    parts.append(archive.read(ex,sym,tf,max(since,a_start),min(until,a_end-1)))
+    if until>=a_end: parts.append(_frame(con.execute(sql,(ex,sym,a_end,until)).fetchall(),OHLCV_COLS))
+    parts=[f for f in parts if not f.empty] or parts[:1]
+    if len(parts)==1: return parts[0]
+    import pandas as pd
+    return pd.concat(parts,ignore_index=True)
+
+def load_ohlcv_many(con: sqlite3.Connection, ex: str, syms: List[str], since: int, until: int, archive: Optional["OHLCVArchive"]=None, tf: str="") -> "pd.DataFrame":
+    """Every symbol of an exchange for a window; long frame with a `symbol` column, sorted by symbol then time.
+
+    One query without an archive. With one, each symbol's archived span is sliced from its memmaps and SQLite is
+    read with one query for the spans before the archives (heads) and one for the spans after them (tails)."""
+    cols=["symbol",*OHLCV_COLS]
+    def query(names, lo, hi):
+        sql=(f"SELECT symbol,timestamp,open,high,low,close,volume FROM ohlcv WHERE exchange=? AND symbol IN ({','.join('?'*len(names))}) "
+             "AND timestamp BETWEEN ? AND ? ORDER BY symbol,timestamp")
+        return _frame(con.execute(sql,(ex,*names,lo,hi)).fetchall(), cols)
+    if archive is None: return query(syms,since,until)
+    import pandas as pd
+    head,tail,parts={},{},[]  # symbol => last head / first tail candle time still read from SQLite
+    for s in syms:
+        a_start,a_end=archive.span(ex,s,tf)
+        if a_end<=since or a_start>until: head[s]=until; continue  # nothing archived in the window
+        if since<a_start: head[s]=a_start-1
+        parts.append(archive.read(ex,s,tf,max(since,a_start),min(until,a_end-1)).assign(symbol=s)[cols])
+        if until>=a_end: tail[s]=a_end
+    # the shared bounds can over-read a symbol whose own span differs; trimmed back per symbol below
+    if head:
+        f=query(list(head),since,max(head.values()))
+        parts.append(f[f["timestamp"]<=pd.to_datetime(f["symbol"].map(head).astype("int64"),unit="ms",utc=True)])
+    if tail:
+        f=query(list(tail),min(tail.values()),until)
+        parts.append(f[f["timestamp"]>=pd.to_datetime(f["symbol"].map(tail).astype("int64"),unit="ms",utc=True)])
+    parts=[f for f in parts if not f.empty]
+    if not parts: return _frame([],cols)
+    return pd.concat(parts,ignore_index=True).sort_values(["symbol","timestamp"],kind="stable",ignore_index=True)
+
+###############################################################################
+# Coverage index
+###############################################################################
+
+def merge_intervals(ivs: List[tuple]) -> List[tuple]:
+    """Sort and merge overlapping or touching [start, end) intervals."""
+    out=[]
+    for s,e in sorted(ivs):
+        if out and s<=out[-1][1]: out[-1]=(out[-1][0],max(out[-1][1],e))
+        elif s<e: out.append((s,e))
+    return out
+
+def uncovered(cov: List[tuple], start: int, end: int) -> List[tuple]:
+    """Gaps of [start, end) not covered by the merged intervals `cov`."""
+    gaps=[]; cur=start
+    for s,e in cov:
+        if e<=cur: continue
+        if s>=end: break
+        if s>cur: gaps.append((cur,s))
+        cur=max(cur,e)
+    if cur<end: gaps.append((cur,end))
+    return gaps
+
+def load_coverage(con: sqlite3.Connection, ex: str, sym: str, tf: str) -> List[tuple]:
+    rows=con.execute("SELECT start_ms,end_ms FROM ohlcv_coverage WHERE exchange=? AND symbol=? AND timeframe=? ORDER BY start_ms",(ex,sym,tf)).fetchall()
+    if rows: return rows
+    # first run on a cache filled before coverage existed: seed from runs of consecutive candles (last one may have been partial)
+    tf_ms=parse_tf(tf)
+    return merge_intervals(con.execute("""SELECT MIN(timestamp), MAX(timestamp) FROM (
+        SELECT timestamp, timestamp/? - ROW_NUMBER() OVER (ORDER BY timestamp) AS g FROM ohlcv WHERE exchange=? AND symbol=?) GROUP BY g""",(tf_ms,ex,sym)).fetchall())
+
+def add_coverage(con: sqlite3.Connection, ex: str, sym: str, tf: str, start: int, end: int):
+    """Record [start, end) as fetched, merging with what is already there."""
+    if end<=start: return
+    merged=merge_intervals(load_coverage(con,ex,sym,tf)+[(start,end)])
+    with con:
+        con.execute("DELETE FROM ohlcv_coverage WHERE exchange=? AND symbol=? AND timeframe=?",(ex,sym,tf))
+        con.executemany("INSERT INTO ohlcv_coverage VALUES(?,?,?,?,?)",[(ex,sym,tf,s,e) for s,e in merged])
+
+###############################################################################
+# Columnar archive
+###############################################################################
+
+class OHLCVArchive:
+    """Append-only columnar candles under `root/<exchange>/<symbol>/<timeframe>/`: `timestamp.i8` plus one
+    `.f8` file per price/volume column, and `meta.json` with the row count and the [start_ms, end_ms) span
+    the rows completely cover, apart from any "gaps" that were recorded as never fetched.
+
+    `meta.json` is replaced last on append and is the only source of truth for the row count, so a crash
+    mid-append leaves a readable archive; the next append truncates the stray tail first."""
+    DTYPES={c:("int64" if c=="timestamp" else "float64") for c in OHLCV_COLS}
+    def __init__(self, root: Path): self.root=Path(root)
+    def _dir(self, ex: str, sym: str, tf: str) -> Path: return self.root/ex/sym.replace("/","-")/tf
+    def _file(self, d: Path, col: str) -> Path: return d/f"{col}.{'i8' if col=='timestamp' else 'f8'}"
+    def _meta(self, d: Path) -> dict:
+        try: return json.loads((d/"meta.json").read_text())
+        except FileNotFoundError: return {}
+    def span(self, ex: str, sym: str, tf: str) -> tuple:
+        m=self._meta(self._dir(ex,sym,tf)); return (m.get("start_ms",0), m.get("end_ms",0))
+    def read(self, ex: str, sym: str, tf: str, since: int, until: int) -> "pd.DataFrame":
+        """Candles with since <= timestamp <= until, sliced out of the memmaps by binary search on timestamp."""
+        d=self._dir(ex,sym,tf); n=self._meta(d).get("rows",0)
+        if not n: return _frame([],OHLCV_COLS)
+        import numpy as np, pandas as pd
+        cols={c:np.memmap(self._file(d,c),dtype=dt,mode="r",shape=(n,)) for c,dt in self.DTYPES.items()}
+        ts=cols["timestamp"]; i,j=np.searchsorted(ts,since,"left"),np.searchsorted(ts,until,"right")
+        df=pd.DataFrame({c:cols[c][i:j] for c in OHLCV_COLS[1:]},copy=False)
+        df.insert(0,"timestamp",pd.to_datetime(np.asarray(ts[i:j]),unit="ms",utc=True))
+        return df
+    def append(self, ex: str, sym: str, tf: str, df: "pd.DataFrame", start_ms: int, end_ms: int, gap: bool=False):
+        """Append candles (epoch-ms `timestamp`) that, with what is archived, completely cover [.., end_ms).
+        With `gap`, [archive end, start_ms) is recorded in meta "gaps" as permanently missing instead of refused."""
+        d=self._dir(ex,sym,tf); d.mkdir(parents=True,exist_ok=True); m=self._meta(d); n=m.get("rows",0)
+        gaps=m.get("gaps",[])
+        if m and start_ms!=m["end_ms"]:
+            if not gap or start_ms<m["end_ms"]: raise ValueError(f"archive {d} ends at {m['end_ms']}, append starts at {start_ms}")
+            gaps=gaps+[[m["end_ms"],start_ms]]
+        import numpy as np
+        df=df[(df["timestamp"]>=start_ms)&(df["timestamp"]<end_ms)].sort_values("timestamp")
+        for c,dt in self.DTYPES.items():
+            with open(self._file(d,c),"ab") as fh:
+                fh.truncate(n*8); fh.write(np.ascontiguousarray(df[c].to_numpy(dt)).tobytes())
+        tmp=d/"meta.json.tmp"
+        meta={"rows":n+len(df),"start_ms":m.get("start_ms",start_ms),"end_ms":end_ms}
+        if gaps: meta["gaps"]=gaps
+        tmp.write_text(json.dumps(meta)); os.replace(tmp,d/"meta.json")
+
+def sync_archive(con: sqlite3.Connection, archive: OHLCVArchive, ex: str, sym: str, tf: str, horizon: int=0) -> int:
+    """Move the archive's end forward through the covered SQLite span it touches; returns candles appended.
+
+    Only ranges the coverage index marks complete are archived, so the append-only files never have holes that
+    a later backfill would need to patch. A coverage hole at the archive's end that lies entirely before `horizon`
+    (the oldest candle the caller still fetches) will never be filled: it is recorded as a gap and the archive
+    continues at the next covered interval. A hole after `horizon` is left for the next fetch."""
+    a_start,a_end=archive.span(ex,sym,tf); cov=load_coverage(con,ex,sym,tf)
+    if not cov: return 0
+    gap=False
+    if not a_end: s,e=cov[0]
+    else:
+        s,e=next(((a_end,e) for cs,e in cov if cs<=a_end<e),(a_end,a_end))
+        if e<=s:
+            cs,ce=next(((cs,ce) for cs,ce in cov if cs>a_end),(a_end,a_end))
+            if ce<=cs: return 0
+            if cs>horizon:
+                logging.debug("archive %s %s %s: waiting for [%d, %d) to be fetched",ex,sym,tf,a_end,cs); return 0
+            logging.warning("archive %s %s %s: [%d, %d) was never fetched; recorded as a gap, continuing at %d",ex,sym,tf,a_end,cs,cs)
+            s,e,gap=cs,ce,True
+    rows=con.execute("SELECT timestamp,open,high,low,close,volume FROM ohlcv WHERE exchange=? AND symbol=? AND timestamp>=? AND timestamp<? ORDER BY timestamp",(ex,sym,s,e)).fetchall()
+    import pandas as pd
+    archive.append(ex,sym,tf,pd.DataFrame.from_records(rows,columns=OHLCV_COLS),s,e,gap=gap)
+    return len(rows)
+
+###############################################################################
+# Threading
+###############################################################################
+
+class SQLiteWriter(threading.Thread):
+    """Single writer thread: fetch workers queue their writes (callables taking the connection) here
+    instead of contending for the SQLite write lock. Writes run in submission order."""
+    def __init__(self, path: Path):
+        super().__init__(daemon=True, name="sqlite-writer"); self.path=path; self.q=queue.Queue(); self.start()
+    def run(self):
+        con=ensure_db(self.path)
+        while True:
+            fn=self.q.get()
+            try: fn(con)
+            except Exception as e: logging.error("sqlite write failed: %s",e)
+            finally: self.q.task_done()
+    def submit(self, fn): self.q.put(fn)
+    def wait(self): self.q.join()
+
+_tls=threading.local()
+def reader_con(path: Path) -> sqlite3.Connection:
+    """Per-thread read connection (sqlite3 connections must not be shared across threads)."""
+    if getattr(_tls,"con",None) is None: _tls.con=connect(path)
+    return _tls.con
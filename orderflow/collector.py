@@ -1,31 +1,432 @@
-"""Collects order-book / trade WS and OI REST and publishes to Redis."""
-import asyncio, json, aiohttp, websockets
-from settings import WATCH_TARGETS, POLL_INTERVAL_SEC, REDIS_STREAM_MAXLEN
-from utils.redis_client import init_redis, close_redis, redis_client
-from utils.agg import add_trade
+"""Collects order-book / trade WS and OI REST and publishes to Redis.
+
+Trades are published as they arrive. Order books are kept locally (`utils.book`) from
+snapshot + diff-depth streams; only derived features every BOOK_FEATURE_SEC and compact
+top-of-book snapshots every BOOK_SNAPSHOT_SEC are published, never the raw diffs.
+"""
+import asyncio, json, logging, random, time, aiohttp, websockets
+from settings import (WATCH_TARGETS, POLL_INTERVAL_SEC, REDIS_STREAM_MAXLEN, BINANCE_UM_WS, BINANCE_CM_WS,
+                      BYBIT_LINEAR_WS, BYBIT_INVERSE_WS, WS_BACKOFF_MAX_SEC, PUBLISH_BATCH, PUBLISH_LINGER_MS,
+                      PUBLISH_MAX_BUFFER,
+                      BINANCE_UM_REST, BINANCE_CM_REST, BYBIT_REST, OI_JITTER_FRAC, OI_RATE_PER_SEC, HTTP_PER_HOST,
+                      STREAM_FORMAT, METRICS_PORT, METRICS_LOG_SEC, BOOK_STREAM_SPEED, BYBIT_BOOK_DEPTH,
+                      BINANCE_DEPTH_LIMIT, BOOK_SNAPSHOT_RATE, BOOK_MAX_LEVELS, BOOK_FEATURE_SEC, BOOK_SNAPSHOT_SEC,
+                      BOOK_SNAPSHOT_LEVELS, BOOK_SNAPSHOT_MAXLEN, BOOK_TOP_N, BOOK_DEPTH_PCT, BOOK_STALE_SEC)
+from utils.redis_client import init_redis, close_redis
+from utils import redis_client as rds
+from utils import metrics
+from utils.codec import encode_trades
+from utils.book import BinanceBook, BybitBook, SNAP_VERSION
+
+try:
+    from orjson import loads
+except ImportError:  # pragma: no cover
+    from json import loads
+
+TRADE_STREAM = "orderflow:trade"
+OI_STREAM    = "orderflow:oi"
+BOOK_STREAM  = "orderflow:book"       # features per book every BOOK_FEATURE_SEC
+SNAP_STREAM  = "orderflow:book_snap"  # {"v", "ex", "sym", "b": `OrderBook.pack`} every BOOK_SNAPSHOT_SEC
+
+PUB_EVENTS   = metrics.counter("orderflow_published_events", "events XADD'd", ("stream",))
+PUB_BATCH    = metrics.histogram("orderflow_publish_batch", "events per publisher flush", ("stream",), metrics.SIZE_BUCKETS)
+PUB_AGE      = metrics.histogram("orderflow_publish_age_seconds", "age of the oldest event when its flush was acknowledged", ("stream",))
+PUB_ERRORS   = metrics.counter("orderflow_publish_errors", "publisher flushes that failed and were kept for a retry", ("stream",))
+PUB_BLOCKED  = metrics.counter("orderflow_publish_blocked", "publishes that waited on a full publisher buffer", ("stream",))
+WS_FRAMES    = metrics.counter("orderflow_ws_frames", "WS frames received (counted 1-in-FRAME_SAMPLE)", ("socket",))
+WS_PARSE     = metrics.histogram("orderflow_ws_parse_seconds", "frame decode time, sampled 1-in-FRAME_SAMPLE", ("socket",))
+WS_RECONNECT = metrics.counter("orderflow_ws_reconnects", "WS sessions that ended and were retried", ("socket",))
+OI_TIME      = metrics.histogram("orderflow_oi_request_seconds", "OI REST round trip", ("exchange",))
+OI_ERRORS    = metrics.counter("orderflow_oi_errors", "failed OI polls", ("exchange",))
+BOOK_RESYNC  = metrics.counter("orderflow_book_resyncs", "order books that lost sync and were rebuilt", ("exchange", "symbol"))
+BOOK_SNAPSHOT= metrics.histogram("orderflow_book_snapshot_seconds", "REST depth snapshot round trip", ("exchange",))
+BOOK_LEVELS  = metrics.gauge("orderflow_book_levels", "price levels held", ("exchange", "symbol", "side"))
+FRAME_SAMPLE = 100
 
 async def publish_stream(key:str, data:dict):
-    await redis_client.xadd(key, data, maxlen=REDIS_STREAM_MAXLEN, approximate=True)
+    await rds.redis_client.xadd(key, data, maxlen=REDIS_STREAM_MAXLEN, approximate=True)
+    PUB_EVENTS.inc(stream=key)
+
+class StreamPublisher:
+    """Buffers XADDs for one stream and sends them as a single pipeline every
+    `max_batch` events or once the oldest buffered event is `linger_ms` old. With `encode`
+    the whole buffer becomes one packed entry instead of one entry per event.
+
+    A full batch is flushed inline by the producer, so a socket that never yields (frames
+    already queued) still publishes in `max_batch` chunks and slows down with Redis.
+
+    A failed flush puts its events back in front of the buffer and `run` retries with
+    exponential backoff (a partly applied pipeline is sent again: delivery is at least once).
+    Meanwhile producers only buffer, and once `max_buffer` events are held they block until
+    a flush goes through, so an outage stalls the sockets instead of growing without bound.
+    """
+
+    def __init__(self, key:str, max_batch:int=PUBLISH_BATCH, linger_ms:int=PUBLISH_LINGER_MS, encode=None,
+                 max_buffer:int=PUBLISH_MAX_BUFFER):
+        self.key, self.max_batch, self.linger, self.encode = key, max_batch, linger_ms / 1000, encode
+        self.max_buffer = max(max_buffer, max_batch)
+        self.buf = []
+        self.first_at = 0.0      # perf_counter of the oldest buffered event
+        self.failures = 0        # consecutive failed flushes
+        self.drained = asyncio.Event()
+        self.on_flush = None     # optional callback(n_events, oldest_age_sec) after each pipeline round trip
+
+    async def publish(self, data:dict):
+        if not self.buf:
+            self.first_at = time.perf_counter()
+        self.buf.append(data)
+        if len(self.buf) >= self.max_buffer:
+            PUB_BLOCKED.inc(stream=self.key)
+            while len(self.buf) >= self.max_buffer:
+                self.drained.clear()
+                await self.drained.wait()
+        elif len(self.buf) >= self.max_batch and not self.failures:
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Send the buffer; False if Redis failed and the events were kept."""
+        if not self.buf:
+            return True
+        buf, first_at, self.buf = self.buf, self.first_at, []
+        sent = False
+        try:
+            if self.encode:
+                await rds.redis_client.xadd(self.key, self.encode(buf), maxlen=REDIS_STREAM_MAXLEN, approximate=True)
+            else:
+                async with rds.redis_client.pipeline(transaction=False) as pipe:
+                    for data in buf:
+                        pipe.xadd(self.key, data, maxlen=REDIS_STREAM_MAXLEN, approximate=True)
+                    await pipe.execute()
+            sent = True
+        except Exception as e:
+            self.failures += 1
+            PUB_ERRORS.inc(stream=self.key)
+            logging.warning("publish %s failed (%d in a row), %d events kept: %r", self.key, self.failures, len(buf) + len(self.buf), e)
+            return False
+        finally:
+            if not sent:  # also on cancellation, so the shutdown flush still sees them
+                self.buf, self.first_at = buf + self.buf, first_at
+        self.failures = 0
+        self.drained.set()
+        age = time.perf_counter() - first_at
+        PUB_EVENTS.inc(len(buf), stream=self.key); PUB_BATCH.observe(len(buf), stream=self.key); PUB_AGE.observe(age, stream=self.key)
+        if self.on_flush:
+            self.on_flush(len(buf), age)
+        return True
+
+    async def run(self):
+        """Linger timer: flush whatever has waited `linger_ms`; after failures, retry with backoff."""
+        try:
+            while True:
+                if self.failures:
+                    await asyncio.sleep(min(2 ** (self.failures - 1), WS_BACKOFF_MAX_SEC) * random.uniform(0.5, 1.5))
+                    await self.flush()
+                    continue
+                wait = self.linger - (time.perf_counter() - self.first_at) if self.buf else self.linger
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                elif self.buf:
+                    await self.flush()
+        finally:
+            await self.flush()
+
+# --- per-exchange frame decoders ------------------------------
+
+def parse_binance(raw, syms:dict):
+    """Combined-stream aggTrade frame => trades (`m` = buyer is maker, i.e. taker sold)."""
+    d = loads(raw).get("data")
+    if not d or d.get("e") != "aggTrade":
+        return ()
+    return ({"ex": "binance", "sym": syms[d["s"]], "side": "sell" if d["m"] else "buy", "px": d["p"], "qty": d["q"], "ts": d["T"]},)
+
+def parse_bybit(raw, syms:dict):
+    """v5 publicTrade frame => trades."""
+    m = loads(raw)
+    if not m.get("topic", "").startswith("publicTrade."):
+        return ()
+    return [{"ex": "bybit", "sym": syms[t["s"]], "side": "buy" if t["S"] == "Buy" else "sell", "px": t["p"], "qty": t["v"], "ts": t["T"]}
+            for t in m["data"]]
+
+def trade_sockets():
+    """Group WATCH_TARGETS into one socket per exchange endpoint: [(name, url, subscribe msgs, parse, app ping)]."""
+    groups = {}  # (exchange, base url) => {exchange symbol: watchlist symbol}
+    for ex, market, sym in WATCH_TARGETS:
+        if market != "Futures":
+            logging.warning("no trade feed for %s %s %s", ex, market, sym); continue
+        linear = sym.endswith(("USDT", "USDC"))
+        if ex == "binance":
+            groups.setdefault((ex, BINANCE_UM_WS if linear else BINANCE_CM_WS), {})[sym if linear else f"{sym}_PERP"] = sym
+        elif ex == "bybit":
+            groups.setdefault((ex, BYBIT_LINEAR_WS if linear else BYBIT_INVERSE_WS), {})[sym] = sym
+        else:
+            logging.warning("no trade feed for %s %s %s", ex, market, sym)
+    out = []
+    for (ex, base), syms in groups.items():
+        if ex == "binance":
+            url = base + "?streams=" + "/".join(f"{s.lower()}@aggTrade" for s in syms)
+            out.append((f"binance:{base}", url, [], lambda raw, s=syms: parse_binance(raw, s), None))
+        else:
+            sub = [{"op": "subscribe", "args": [f"publicTrade.{s}" for s in syms]}]
+            out.append((f"bybit:{base}", base, sub, lambda raw, s=syms: parse_bybit(raw, s), {"op": "ping"}))
+    return out
+
+async def ws_supervisor(name:str, url:str, subscribe:list, parse, pub:StreamPublisher, app_ping:dict | None = None):
+    """Keep one socket alive: connect, subscribe, decode, publish; reconnect with jittered exponential backoff."""
+    delay = 1
+    sample = metrics.Sampler(FRAME_SAMPLE)
+    while True:
+        started = time.monotonic()
+        try:
+            async with websockets.connect(url, max_size=2 ** 22, compression=None, ping_interval=20) as ws:
+                logging.info("%s connected", name)
+                for msg in subscribe:
+                    await ws.send(json.dumps(msg))
+                pinger = asyncio.create_task(_app_ping(ws, app_ping)) if app_ping else None
+                try:
+                    async for raw in ws:
+                        if sample():
+                            t = time.perf_counter(); trades = parse(raw)
+                            WS_PARSE.observe(time.perf_counter() - t, socket=name); WS_FRAMES.inc(FRAME_SAMPLE, socket=name)
+                        else:
+                            trades = parse(raw)
+                        for trade in trades:
+                            await pub.publish(trade)
+                finally:
+                    if pinger:
+                        pinger.cancel()
+            logging.warning("%s closed by server", name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("%s error: %r", name, e)
+        WS_RECONNECT.inc(socket=name)
+        if time.monotonic() - started > 60:
+            delay = 1  # the last session was healthy; start the backoff over
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        delay = min(delay * 2, WS_BACKOFF_MAX_SEC)
+
+async def _app_ping(ws, msg:dict, every:float=20):
+    """Exchanges like Bybit drop sockets that don't send an application-level ping."""
+    payload = json.dumps(msg)
+    while True:
+        await asyncio.sleep(every)
+        await ws.send(payload)
 
-async def collect_trades():
-    """Connect to WS for trades (placeholder)."""
-    # TODO: implement real WS handlers per exchange
-    pass
+async def collect_trades(pub:StreamPublisher | None = None):
+    """One supervised WS per exchange endpoint, all feeding a batched XADD publisher."""
+    pub = pub or StreamPublisher(TRADE_STREAM, encode=encode_trades if STREAM_FORMAT == "packed" else None)
+    await asyncio.gather(pub.run(), *(ws_supervisor(name, url, sub, parse, pub, ping) for name, url, sub, parse, ping in trade_sockets()))
+
+# --- open interest ---------------------------------------------
+
+class RateBudget:
+    """Token bucket: at most `rate` requests/s, bursts of `burst`."""
+
+    def __init__(self, rate:float, burst:int=1):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.at = float(burst), time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.at) * self.rate); self.at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1; return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def oi_request(ex:str, sym:str):
+    """(url, params, parse(json) -> (ts_ms, oi str)) for one watchlist target."""
+    linear = sym.endswith(("USDT", "USDC"))
+    if ex == "binance":
+        url = f"{BINANCE_UM_REST}/fapi/v1/openInterest" if linear else f"{BINANCE_CM_REST}/dapi/v1/openInterest"
+        return url, {"symbol": sym if linear else f"{sym}_PERP"}, lambda j: (j["time"], j["openInterest"])
+    if ex == "bybit":
+        return (f"{BYBIT_REST}/v5/market/tickers", {"category": "linear" if linear else "inverse", "symbol": sym},
+                lambda j: (j["time"], j["result"]["list"][0]["openInterest"]))
+    raise ValueError(f"no OI endpoint for {ex}")
+
+def http_session() -> aiohttp.ClientSession:
+    """One pooled keep-alive session shared by every REST poller."""
+    conn = aiohttp.TCPConnector(limit_per_host=HTTP_PER_HOST, keepalive_timeout=max(60, 2 * POLL_INTERVAL_SEC), ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=conn, timeout=aiohttp.ClientTimeout(total=5))
+
+async def poll_target(session, ex:str, sym:str, offset:float, budget:RateBudget, last:dict):
+    """Poll one target every POLL_INTERVAL_SEC (± jitter) starting at `offset`; publish only changed values."""
+    url, params, parse = oi_request(ex, sym)
+    loop = asyncio.get_running_loop()
+    due = loop.time() + offset
+    while True:
+        jitter = random.uniform(-OI_JITTER_FRAC, OI_JITTER_FRAC) * POLL_INTERVAL_SEC
+        await asyncio.sleep(max(0, due + jitter - loop.time()))
+        due += POLL_INTERVAL_SEC
+        await budget.acquire()
+        try:
+            with OI_TIME.time(exchange=ex):
+                async with session.get(url, params=params) as resp:
+                    resp.raise_for_status()
+                    ts, oi = parse(await resp.json(loads=loads))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            OI_ERRORS.inc(exchange=ex)
+            logging.warning("OI %s %s: %r", ex, sym, e); continue
+        if last.get((ex, sym)) == oi:
+            continue
+        try:
+            await publish_stream(OI_STREAM, {"ex": ex, "sym": sym, "oi": oi, "ts": int(ts)})
+        except Exception as e:  # Redis away: drop this sample, the next poll publishes again
+            PUB_ERRORS.inc(stream=OI_STREAM)
+            logging.warning("OI %s %s publish failed: %r", ex, sym, e); continue
+        last[(ex, sym)] = oi
 
 async def poll_open_interest():
-    """10-second REST pollers for Binance/Bybit OI."""
-    # TODO: loop through WATCH_TARGETS and poll REST endpoints
-    pass
+    """OI REST pollers for every WATCH_TARGETS entry, spread evenly across the interval."""
+    targets = [(ex, sym) for ex, market, sym in WATCH_TARGETS if market == "Futures" and ex in OI_RATE_PER_SEC]
+    if not targets:
+        logging.warning("no OI targets in WATCH_TARGETS (futures on %s); OI polling off", ", ".join(OI_RATE_PER_SEC)); return
+    budgets = {ex: RateBudget(rate) for ex, rate in OI_RATE_PER_SEC.items()}
+    last = {}
+    async with http_session() as session:
+        await asyncio.gather(*(poll_target(session, ex, sym, i * POLL_INTERVAL_SEC / len(targets), budgets[ex], last)
+                               for i, (ex, sym) in enumerate(targets)))
+
+# --- order books ----------------------------------------------
+
+def parse_binance_depth(raw, books:dict, wanted:dict):
+    """Combined-stream depthUpdate frame => applied to its book; wakes the snapshot fetcher when unsynced."""
+    d = loads(raw).get("data")
+    if d and d.get("e") == "depthUpdate" and books[d["s"]].on_diff(d):
+        wanted[d["s"]].set()
+    return ()
+
+def parse_bybit_book(raw, books:dict):
+    """v5 orderbook frame => applied to its book (raises `BookGap` on a skipped update)."""
+    m = loads(raw)
+    if m.get("topic", "").startswith("orderbook."):
+        books[m["data"]["s"]].on_message(m)
+    return ()
+
+def depth_request(sym:str):
+    """Binance REST depth snapshot (url, params) for one watchlist symbol."""
+    if sym.endswith(("USDT", "USDC")):
+        return f"{BINANCE_UM_REST}/fapi/v1/depth", {"symbol": sym, "limit": BINANCE_DEPTH_LIMIT}
+    return f"{BINANCE_CM_REST}/dapi/v1/depth", {"symbol": f"{sym}_PERP", "limit": BINANCE_DEPTH_LIMIT}
+
+def _count_resync(book, reason:str):
+    BOOK_RESYNC.inc(exchange=book.exchange, symbol=book.symbol)
+    logging.warning("book %s %s lost sync: %s", book.exchange, book.symbol, reason)
+
+def book_sockets():
+    """Like `trade_sockets`, for depth streams: ([(name, url, subscribe msgs, parse, app ping)], books, wanted)
+    with books {exchange symbol: OrderBook} per exchange and wanted {exchange symbol: Event} for Binance books."""
+    groups = {}
+    for ex, market, sym in WATCH_TARGETS:
+        if market != "Futures" or ex not in ("binance", "bybit"):
+            logging.warning("no book feed for %s %s %s", ex, market, sym); continue
+        linear = sym.endswith(("USDT", "USDC"))
+        if ex == "binance":
+            book = BinanceBook(ex, sym, BOOK_MAX_LEVELS)
+            groups.setdefault((ex, BINANCE_UM_WS if linear else BINANCE_CM_WS), {})[sym if linear else f"{sym}_PERP"] = book
+        else:
+            book = BybitBook(ex, sym, BOOK_MAX_LEVELS)
+            groups.setdefault((ex, BYBIT_LINEAR_WS if linear else BYBIT_INVERSE_WS), {})[sym] = book
+        book.on_resync = _count_resync
+    out, books, wanted = [], {}, {}
+    for (ex, base), group in groups.items():
+        books.update({(ex, s): b for s, b in group.items()})
+        if ex == "binance":
+            ev = {s: asyncio.Event() for s in group}
+            for e in ev.values():
+                e.set()  # every book starts out needing a snapshot
+            wanted.update({(ex, s): e for s, e in ev.items()})
+            url = base + "?streams=" + "/".join(f"{s.lower()}@depth@{BOOK_STREAM_SPEED}" for s in group)
+            out.append((f"binance-book:{base}", url, [], lambda raw, b=group, w=ev: parse_binance_depth(raw, b, w), None))
+        else:
+            sub = [{"op": "subscribe", "args": [f"orderbook.{BYBIT_BOOK_DEPTH}.{s}" for s in group]}]
+            out.append((f"bybit-book:{base}", base, sub, lambda raw, b=group: parse_bybit_book(raw, b), {"op": "ping"}))
+    return out, books, wanted
+
+async def sync_binance_book(session, book:BinanceBook, wanted:asyncio.Event, budget:RateBudget):
+    """Fetch a REST snapshot whenever the book asks for one; diffs buffer meanwhile."""
+    url, params = depth_request(book.symbol)
+    delay = 1
+    while True:
+        await wanted.wait()
+        await asyncio.sleep(0.5)  # let the socket buffer a few diffs first, so the snapshot can be bridged
+        wanted.clear()
+        if not book.need_snapshot:
+            continue
+        await budget.acquire()
+        try:
+            with BOOK_SNAPSHOT.time(exchange=book.exchange):
+                async with session.get(url, params=params) as resp:
+                    resp.raise_for_status()
+                    snap = await resp.json(loads=loads)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("depth snapshot %s: %r", book.symbol, e)
+            await asyncio.sleep(delay); delay = min(delay * 2, WS_BACKOFF_MAX_SEC)
+            wanted.set(); continue
+        delay = 1
+        if book.on_snapshot(snap):
+            logging.info("book binance %s loaded at %d", book.symbol, snap["lastUpdateId"])
+        else:
+            wanted.set()
+
+async def publish_books(books:dict, pub:StreamPublisher):
+    """Features of every live book each BOOK_FEATURE_SEC, packed snapshots each BOOK_SNAPSHOT_SEC."""
+    next_snap = 0.0
+    while True:
+        await asyncio.sleep(BOOK_FEATURE_SEC - time.time() % BOOK_FEATURE_SEC)
+        now = time.time()
+        snap = now >= next_snap
+        if snap:
+            next_snap = now + BOOK_SNAPSHOT_SEC
+        for book in books.values():
+            BOOK_LEVELS.set(len(book.bids), exchange=book.exchange, symbol=book.symbol, side="bid")
+            BOOK_LEVELS.set(len(book.asks), exchange=book.exchange, symbol=book.symbol, side="ask")
+            if not book.synced or now - book.ts / 1000 > BOOK_STALE_SEC:
+                continue
+            f = book.features(BOOK_TOP_N, BOOK_DEPTH_PCT)
+            if f is None:
+                continue
+            await pub.publish({"ex": book.exchange, "sym": book.symbol, "ts": int(now * 1000), **f})
+            if snap:
+                try:
+                    await rds.redis_client.xadd(SNAP_STREAM, {"v": str(SNAP_VERSION), "ex": book.exchange, "sym": book.symbol,
+                                                              "b": book.pack(BOOK_SNAPSHOT_LEVELS)},
+                                                maxlen=BOOK_SNAPSHOT_MAXLEN, approximate=True)
+                except Exception as e:  # Redis away: skip this round's snapshots, the next round sends fresh ones
+                    PUB_ERRORS.inc(stream=SNAP_STREAM)
+                    logging.warning("book snapshot publish failed: %r", e)
+                    snap = False; continue
+                PUB_EVENTS.inc(stream=SNAP_STREAM)
+
+async def collect_books():
+    """Supervised depth sockets, Binance snapshot fetchers and the feature/snapshot publisher."""
+    sockets, books, wanted = book_sockets()
+    pub = StreamPublisher(BOOK_STREAM)
+    budget = RateBudget(BOOK_SNAPSHOT_RATE, burst=2)
+    async with http_session() as session:
+        await asyncio.gather(pub.run(), publish_books(books, pub),
+                             *(ws_supervisor(name, url, sub, parse, pub, ping) for name, url, sub, parse, ping in sockets),
+                             *(sync_binance_book(session, books[key], ev, budget) for key, ev in wanted.items()))
 
 async def main():
+    metrics.start(METRICS_PORT, METRICS_LOG_SEC)
     await init_redis()
     try:
         await asyncio.gather(
             collect_trades(),
+            collect_books(),
             poll_open_interest(),
         )
     finally:
         await close_redis()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     asyncio.run(main())
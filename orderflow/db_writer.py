@@ -1,61 +1,380 @@
-"""Consumes Redis streams and flushes to PostgreSQL every FLUSH_SEC seconds."""
-import asyncio, time
-from utils.redis_client import init_redis, redis_client, close_redis
-from utils.db import init_db, close_db, pg_pool
-from utils.agg import add_trade, flush_buckets
-from settings import FLUSH_SEC
+"""Consumes Redis streams and flushes to PostgreSQL every FLUSH_SEC seconds.
+
+Run any number of these in the `db-writer` group, each with its own WRITER_CONSUMER name.
+Entries are only XACK'd after the flush that persisted their bucket has committed (buckets
+still open under the watermark keep their entries pending), so anything a crashed writer had
+buffered is still pending and gets re-read (own PEL on restart) or
+XAUTOCLAIM'd by a surviving writer once idle for CLAIM_MIN_IDLE_MS. Merges are additive, so
+every transaction also logs its batch id, the entry ids it makes ackable and, for entries still
+pending whose older trades it wrote, the second each series went out through (writer_batches);
+re-read or claimed entries listed there are acked, or merged only past that second.
+
+A flush swaps the closed buckets out of the store synchronously (`take_batch`) and writes
+them in a background task while consumption continues; one write is in flight at a time.
+Flushes also start early once FLUSH_MAX_BUCKETS buckets are buffered. At MAX_OPEN_BUCKETS
+reading stops until the in-flight write finishes, and open buckets are flushed early as
+partial rows (the upserts merge them). A batch Postgres rejects or does not take within
+FLUSH_TIMEOUT_SEC is spilled to the local journal (JOURNAL_DIR) and acked from there; the
+journal is replayed, oldest first, after each successful write and at startup. Replay is
+idempotent through writer_batches, so a flush that failed inside COMMIT but did commit is not
+written twice; a batch Postgres rejects JOURNAL_MAX_ATTEMPTS times is set aside as *.bad.
+"""
+import asyncio, logging, time
+import asyncpg
+from collections import defaultdict
+from datetime import datetime, timezone
+import numpy as np
+from utils.redis_client import init_redis, close_redis
+from utils import redis_client as rds
+from utils.db import (init_db, close_db, insert_trade_agg_1s, insert_trade_rollup, insert_open_interest,
+                      record_batch, settle_batches, fetch_unsettled_acks, prune_batches)
+from utils import db
+from utils.agg import add_trades, drain_closed, bucket_records, cascade, rollup_records, is_flushed, series_id
+from utils.codec import decode_entries
+from utils.journal import Journal
+from utils import agg, metrics
+from settings import (FLUSH_SEC, WRITER_CONSUMER, READ_COUNT, CLAIM_MIN_IDLE_MS, CLAIM_INTERVAL_SEC,
+                      METRICS_PORT, METRICS_LOG_SEC, FLUSH_MAX_BUCKETS, MAX_OPEN_BUCKETS, FLUSH_TIMEOUT_SEC,
+                      JOURNAL_DIR, COMMIT_LOG_DAYS, JOURNAL_MAX_ATTEMPTS)
 
 STREAMS = {"orderflow:oi": ">", "orderflow:trade": ">"}
 GROUP   = "db-writer"
-CONSUMER= "writer-1"
+CONSUMER= WRITER_CONSUMER
+ACK_CHUNK = 1000
+
+# stream => [(msg_id, series_id | -1, newest bucket_start, oldest bucket_start of that series in the entry)]
+# consumed, not yet committed; a packed entry has one row per series it carries and is acked once all of them
+# are flushed
+pending_acks = defaultdict(list)
+oi_rows = []  # OI_COLS tuples waiting for the next flush
+flush_task = None   # background write of the last batch taken; at most one in flight
+flush_batch = None  # ... and that batch, for its acks
+journal = None      # Journal, opened by main()
+settled = []        # ids of committed batches whose entries have since been XACK'd; cleared in the next transaction
+pruned_at = 0.0     # time.time() of the last writer_batches prune
+PRUNE_EVERY_SEC = 3600
+replay_rejects = {}  # journal file name => replays Postgres rejected
+# what a replay of the same rows can't get past (bad values, a constraint, an unreadable file), as opposed to
+# Postgres being unreachable, restarting or overloaded; asyncpg's client-side DataError is a ValueError
+REJECTED = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError, ValueError, KeyError, TypeError)
+
+READ_BATCH   = metrics.histogram("orderflow_writer_read_entries", "entries per XREADGROUP/XAUTOCLAIM batch", ("stream",), metrics.SIZE_BUCKETS)
+TRADES_IN    = metrics.counter("orderflow_writer_trades", "trades decoded from the stream")
+FLUSH_TIME   = metrics.histogram("orderflow_writer_flush_seconds", "flush_to_db duration (one transaction)")
+FLUSH_ROWS   = metrics.counter("orderflow_writer_rows", "rows written by flush_to_db", ("table",))
+ACKED        = metrics.counter("orderflow_writer_acked", "entries XACK'd", ("stream",))
+OPEN_BUCKETS = metrics.gauge("orderflow_writer_open_buckets", "1s buckets held in memory (trade_buckets)")
+BUCKET_BYTES = metrics.gauge("orderflow_writer_bucket_bytes", "bytes of the trade_buckets arrays")
+UNACKED      = metrics.gauge("orderflow_writer_unacked", "consumed entries waiting for their buckets to flush", ("stream",))
+GROUP_PENDING= metrics.gauge("orderflow_stream_pending", "consumer-group entries delivered but not acked", ("stream",))
+GROUP_LAG    = metrics.gauge("orderflow_stream_lag", "consumer-group entries not yet delivered", ("stream",))
+JOURNALED    = metrics.counter("orderflow_writer_journaled_batches", "batches spilled to the local journal")
+SKIPPED      = metrics.counter("orderflow_writer_skipped", "re-read entries acked without merging, their rows had committed", ("stream",))
+REPLAYED     = metrics.counter("orderflow_writer_replayed_batches", "journaled batches written to Postgres")
+QUARANTINED  = metrics.counter("orderflow_writer_quarantined_batches", "journaled batches set aside as *.bad")
+JOURNAL_SIZE = metrics.gauge("orderflow_writer_journal_batches", "batches waiting in the local journal")
+BACKPRESSURE = metrics.counter("orderflow_writer_backpressure_seconds", "time reading was paused at MAX_OPEN_BUCKETS")
+
+def _str(msg_id) -> str:
+    return msg_id.decode() if isinstance(msg_id, bytes) else msg_id
 
 async def ensure_groups():
     for stream in STREAMS:
         try:
-            await redis_client.xgroup_create(stream, GROUP, id="$", mkstream=True)
+            await rds.redis_client.xgroup_create(stream, GROUP, id="$", mkstream=True)
         except Exception:
             pass  # group exists
 
+def handle_entries(stream, entries, committed:dict | None = None):
+    """Aggregate stream entries and queue their acks. `committed` (entry id => {(exchange, symbol): bucket start})
+    drops the trades of redelivered entries that an earlier transaction already wrote."""
+    stream = stream.decode() if isinstance(stream, bytes) else stream
+    READ_BATCH.observe(len(entries), stream=stream)
+    live = [(msg_id, d) for msg_id, d in entries if d]
+    # entries trimmed by MAXLEN while pending come back empty; they only need the XACK
+    pending_acks[stream].extend((msg_id, -1, 0, 0) for msg_id, d in entries if not d)
+    if stream.endswith(":trade") and live:
+        batch = decode_entries(live, series_id)
+        if committed:
+            keep = np.ones(len(batch["ts"]), bool)
+            for i, (msg_id, _) in enumerate(live):
+                for (ex, sym), through in committed.get(_str(msg_id), {}).items():
+                    keep[(batch["entry"] == i) & (batch["sid"] == series_id(ex, sym)) & (batch["ts"] // 1000 < through)] = False
+            if not keep.all():
+                batch = {k: v[keep] for k, v in batch.items()}
+        secs = add_trades(batch)
+        TRADES_IN.inc(len(secs))
+        # newest bucket per (entry, series): the entry is safe to ack once that one is flushed
+        keys = batch["entry"] << 32 | batch["sid"]
+        order = np.lexsort((secs, keys))
+        k = keys[order]
+        last = np.flatnonzero(np.r_[k[1:] != k[:-1], True])
+        first = np.r_[0, last[:-1] + 1] if len(last) else last
+        ss = secs[order]
+        pending_acks[stream].extend((live[kk >> 32][0], kk & 0xFFFFFFFF, new, old)
+                                    for kk, new, old in zip(k[last].tolist(), ss[last].tolist(), ss[first].tolist()))
+        # entries left without trades (all of them already committed) still need their XACK
+        seen = np.zeros(len(live), bool); seen[batch["entry"]] = True
+        pending_acks[stream].extend((live[i][0], -1, 0, 0) for i in np.flatnonzero(~seen).tolist())
+    elif stream.endswith(":oi"):
+        oi_rows.extend((datetime.fromtimestamp(int(d[b"ts"]) / 1000, tz=timezone.utc), d[b"ex"].decode(), d[b"sym"].decode(), float(d[b"oi"]))
+                       for _, d in live)
+        pending_acks[stream].extend((msg_id, -1, 0, 0) for msg_id, _ in live)
+
+def take_ackable() -> tuple:
+    """Move every consumed entry whose buckets have all been drained out of `pending_acks`. Returns (stream => ids,
+    stream => {id: [[exchange, symbol, flushed_until]]} for the entries left pending that have a drained bucket).
+
+    Call right after `drain_closed`, with no await in between, so the ids match the drained buckets."""
+    done, partial = {}, {}
+    for stream, entries in pending_acks.items():
+        if not entries:
+            continue
+        sids = np.fromiter((e[1] for e in entries), np.int64, len(entries))
+        secs = np.fromiter((e[2] for e in entries), np.int64, len(entries))
+        ok = sids < 0
+        ok[~ok] = is_flushed(sids[~ok], secs[~ok])
+        blocked = {e[0] for e, f in zip(entries, ok.tolist()) if not f}
+        done[stream] = list(dict.fromkeys(e[0] for e in entries if e[0] not in blocked))
+        pending_acks[stream] = [e for e in entries if e[0] in blocked]
+        # a blocked entry whose oldest bucket in some series is flushed was partly written
+        started = {e[0] for e in pending_acks[stream] if e[1] >= 0 and is_flushed(e[1], e[3])}
+        if started:
+            p = partial[stream] = {}
+            for e in pending_acks[stream]:
+                if e[0] in started and e[1] >= 0:
+                    p.setdefault(_str(e[0]), []).append([*agg.series[e[1]], int(agg.flushed_until[e[1]])])
+    return done, partial
+
+async def xack(done:dict):
+    """Pipelined XACK of stream => ids."""
+    if not any(done.values()):
+        return
+    async with rds.redis_client.pipeline(transaction=False) as pipe:
+        for stream, ids in done.items():
+            for i in range(0, len(ids), ACK_CHUNK):
+                pipe.xack(stream, GROUP, *ids[i:i + ACK_CHUNK])
+        await pipe.execute()
+    for stream, ids in done.items():
+        ACKED.inc(len(ids), stream=stream)
+
+async def sample_gauges():
+    """Point-in-time gauges, refreshed once per flush: buffered state and the consumer group's view of each stream."""
+    OPEN_BUCKETS.set(len(agg.trade_buckets)); BUCKET_BYTES.set(agg.trade_buckets.nbytes)
+    for stream in STREAMS:
+        UNACKED.set(len(pending_acks[stream]), stream=stream)
+        try:
+            group = next(g for g in await rds.redis_client.xinfo_groups(stream) if g["name"] in (GROUP, GROUP.encode()))
+        except Exception:
+            continue
+        GROUP_PENDING.set(group["pending"], stream=stream)
+        if group.get("lag") is not None:  # Redis >= 7
+            GROUP_LAG.set(group["lag"], stream=stream)
+
+async def unsettled_acks() -> tuple | None:
+    """`fetch_unsettled_acks`: entry ids merged by a committed batch but maybe not XACK'd, and entries merged in
+    part; None if Postgres is down."""
+    try:
+        async with db.pg_pool.acquire(timeout=FLUSH_TIMEOUT_SEC) as conn:
+            return await fetch_unsettled_acks(conn)
+    except Exception as e:
+        logging.warning("writer_batches lookup failed: %r", e)
+        return None
+
+def handle_redelivered(stream, entries, done:tuple):
+    """`handle_entries` for re-read/claimed entries: those `unsettled_acks` lists as committed only get acked (as an
+    empty entry would), those committed in part only contribute their trades past that point."""
+    stream = stream.decode() if isinstance(stream, bytes) else stream
+    ids, partial = done[0].get(stream, ()), done[1].get(stream)
+    skip = sum(_str(i) in ids for i, _ in entries)
+    if skip:
+        SKIPPED.inc(skip, stream=stream)
+        entries = [(i, {} if _str(i) in ids else d) for i, d in entries]
+    handle_entries(stream, entries, partial)
+    return skip
+
+async def recover_own_pending():
+    """Re-consume this consumer's PEL: entries delivered before a restart that were never acked. Without
+    Postgres it is left alone (claim_stale takes the entries over once they are idle)."""
+    done = await unsettled_acks()
+    if done is None:
+        return
+    for stream in STREAMS:
+        last, n, skip = "0-0", 0, 0
+        while True:
+            msgs = await rds.redis_client.xreadgroup(GROUP, CONSUMER, {stream: last}, count=READ_COUNT)
+            entries = msgs[0][1] if msgs else []
+            if not entries:
+                break
+            skip += handle_redelivered(stream, entries, done); last = entries[-1][0]; n += len(entries)
+        if n:
+            logging.info("%s: recovered %d own pending entries (%d already committed)", stream, n, skip)
+
+async def claim_stale():
+    """XAUTOCLAIM entries that other (dead) consumers left idle for CLAIM_MIN_IDLE_MS. If Postgres can't say
+    which of them already committed, they stay claimed but unread and are picked up by a later sweep."""
+    done = None
+    for stream in STREAMS:
+        start, n, skip = "0-0", 0, 0
+        mine = {e[0] for e in pending_acks[stream]} | set(flush_batch["acks"].get(stream, ()) if flush_batch else ())
+        while True:
+            res = await rds.redis_client.xautoclaim(stream, GROUP, CONSUMER, CLAIM_MIN_IDLE_MS, start_id=start, count=READ_COUNT)
+            start, entries = res[0], [e for e in res[1] if e[0] not in mine]
+            if entries and done is None:
+                done = await unsettled_acks()
+                if done is None:
+                    return
+            if entries:
+                skip += handle_redelivered(stream, entries, done); n += len(entries)
+            if start in ("0-0", b"0-0"):
+                break
+        if n:
+            logging.info("%s: claimed %d stale entries (%d already committed)", stream, n, skip)
+
 async def process_messages():
-    last_flush = time.time()
+    global flush_task, flush_batch
+    last_flush = last_claim = time.time()
     while True:
-        msgs = await redis_client.xreadgroup(GROUP, CONSUMER, STREAMS, count=500, block=2000)
+        busy = flush_task is not None and not flush_task.done()
+        if busy and len(agg.trade_buckets) >= MAX_OPEN_BUCKETS:
+            t = time.perf_counter()
+            await asyncio.wait({flush_task}, timeout=1)  # backpressure: stop reading until the write lands
+            BACKPRESSURE.inc(time.perf_counter() - t)
+            continue
+        msgs = await rds.redis_client.xreadgroup(GROUP, CONSUMER, STREAMS, count=READ_COUNT, block=2000)
         for stream, entries in msgs:
-            for msg_id, data in entries:
-                if stream.endswith(":trade"):
-                    add_trade(data["ex"], data["sym"], data["side"], float(data["px"]), float(data["qty"]), int(data["ts"]))
-                elif stream.endswith(":oi"):
-                    # TODO: buffer OI if needed, else insert directly later
-                    pass
-                await redis_client.xack(stream, GROUP, msg_id)
-
-        if time.time() - last_flush >= FLUSH_SEC:
-            await flush_to_db()
+            handle_entries(stream, entries)
+
+        if time.time() - last_claim >= CLAIM_INTERVAL_SEC:
+            await claim_stale()
+            last_claim = time.time()
+        if busy and not flush_task.done():
+            continue
+        size = len(agg.trade_buckets)
+        if time.time() - last_flush >= FLUSH_SEC or size >= FLUSH_MAX_BUCKETS:
+            if flush_task is not None and not flush_task.cancelled() and flush_task.exception():
+                logging.error("flush task failed: %r", flush_task.exception())
+            flush_batch = take_batch(force=size >= MAX_OPEN_BUCKETS)
+            flush_task = asyncio.create_task(flush_to_db(flush_batch))
+            await sample_gauges()
             last_flush = time.time()
 
-async def flush_to_db():
-    """Insert aggregated trade + OI rows into Postgres."""
-    async with pg_pool.acquire() as conn:
+def take_batch(force:bool=False) -> dict:
+    """Swap the closed buckets (every bucket when `force`), the OI rows and the entries they make ackable out of
+    the live buffers. Synchronous, so nothing is consumed between the drain and the ack bookkeeping."""
+    closed = drain_closed(force)
+    batch = {"id": f"{CONSUMER}-{time.time_ns()}", "trade_agg_1s": bucket_records(closed),
+             "rollups": [(step, rollup_records(cols)) for step, cols in cascade(closed)],
+             "open_interest": oi_rows[:]}
+    batch["acks"], batch["partial"] = take_ackable()
+    del oi_rows[:]
+    return batch
+
+async def write_batch(batch:dict) -> bool:
+    """One transaction; the inserts are bounded by FLUSH_TIMEOUT_SEC so a hung Postgres rolls back instead of
+    stalling the writer (a failure inside COMMIT itself stays ambiguous). The batch id and its acks are logged to
+    writer_batches in the same transaction and the `settled` batches cleared there. False if the id had already
+    committed, in which case nothing is written."""
+    global pruned_at
+    acks = {stream: [_str(i) for i in ids] for stream, ids in batch.get("acks", {}).items() if ids}
+    partial = batch.get("partial")
+    n_settled, prune = len(settled), time.time() - pruned_at >= PRUNE_EVERY_SEC
+    async def inserts(conn):
+        if "id" in batch and not await record_batch(conn, batch["id"], CONSUMER, acks, partial):
+            return False
+        await settle_batches(conn, settled[:n_settled])
+        await insert_trade_agg_1s(conn, batch["trade_agg_1s"])
+        for step, records in batch["rollups"]:
+            await insert_trade_rollup(conn, step, records)
+        await insert_open_interest(conn, batch["open_interest"])
+        if prune:
+            await prune_batches(conn, COMMIT_LOG_DAYS)
+        return True
+    async with db.pg_pool.acquire(timeout=FLUSH_TIMEOUT_SEC) as conn:
         async with conn.transaction():
-            # insert trades
-            for row in flush_buckets():
-                await conn.execute(
-                    """
-                    INSERT INTO trade_agg_1s (ts_1s,exchange,symbol,side,volume,vwap,trades,min_price,max_price)
-                    VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
-                    ON CONFLICT DO NOTHING
-                    """,
-                    row["ts"], row["exchange"], row["symbol"], row["side"],
-                    row["volume"], row["vwap"], row["trades"], row["min_price"], row["max_price"],
-                )
-            # TODO: insert open_interest_history rows (buffer separately)
+            written = await asyncio.wait_for(inserts(conn), FLUSH_TIMEOUT_SEC)
+    if written:
+        del settled[:n_settled]
+        if prune:
+            pruned_at = time.time()
+    return written
+
+async def flush_to_db(batch:dict):
+    """Write a batch taken by `take_batch` into Postgres and XACK its entries. If Postgres fails, the batch is
+    journaled and acked from there (even if it did commit: the replay finds its id and drops it); after a
+    successful write the oldest journaled batch is replayed."""
+    try:
+        with FLUSH_TIME.time():
+            await write_batch(batch)
+    except Exception as e:
+        if journal is None:
+            raise
+        try:
+            path = journal.write(batch)
+        except OSError as je:
+            logging.error("flush failed (%r) and journal write failed (%r); entries stay pending", e, je)
+            return
+        JOURNALED.inc(); JOURNAL_SIZE.set(len(journal))
+        logging.warning("flush failed (%r): %d rows journaled to %s", e, len(batch["trade_agg_1s"]), path.name)
+    else:
+        FLUSH_ROWS.inc(len(batch["trade_agg_1s"]), table="trade_agg_1s")
+        FLUSH_ROWS.inc(len(batch["open_interest"]), table="open_interest_history")
+        for step, records in batch["rollups"]:
+            FLUSH_ROWS.inc(len(records), table=db.ROLLUP_TABLES[step])
+        if journal is not None:
+            await replay_journal(1)
+    await xack(batch["acks"])
+    settled.append(batch["id"])
+
+async def replay_journal(limit:int | None = None) -> int:
+    """Write journaled batches to Postgres, oldest first. A connection or server failure stops the replay; a
+    batch Postgres rejects is skipped, and set aside as *.bad once rejected JOURNAL_MAX_ATTEMPTS times. A batch
+    whose id already committed is dropped. Returns batches replayed."""
+    n = 0
+    for path in journal.oldest(limit):
+        try:
+            written = await write_batch(journal.read(path))
+        except REJECTED as e:
+            tries = replay_rejects[path.name] = replay_rejects.get(path.name, 0) + 1
+            if tries < JOURNAL_MAX_ATTEMPTS:
+                logging.warning("journal replay of %s rejected (%d/%d): %r", path.name, tries, JOURNAL_MAX_ATTEMPTS, e)
+            else:
+                del replay_rejects[path.name]; QUARANTINED.inc()
+                logging.error("journal replay of %s rejected %d times, moved to %s: %r", path.name, tries, journal.quarantine(path).name, e)
+            continue
+        except Exception as e:
+            logging.warning("journal replay of %s failed: %r", path.name, e)
+            break
+        if not written:
+            logging.info("journaled batch %s had already committed; dropped", path.name)
+        journal.remove(path); replay_rejects.pop(path.name, None); n += 1; REPLAYED.inc()
+    if n:
+        logging.info("replayed %d journaled batches, %d left", n, len(journal))
+    JOURNAL_SIZE.set(len(journal))
+    return n
+
+async def drain_flush():
+    """Wait for the in-flight write, then write everything still buffered (shutdown)."""
+    if flush_task is not None:
+        await asyncio.gather(flush_task, return_exceptions=True)
+    await flush_to_db(take_batch(force=True))
 
 async def main():
+    global journal
+    metrics.start(METRICS_PORT, METRICS_LOG_SEC)
+    journal = Journal(JOURNAL_DIR)
     await init_redis(); await init_db(); await ensure_groups()
     try:
+        await replay_journal()
+        await recover_own_pending()
+        await claim_stale()
         await process_messages()
     finally:
-        await close_db(); await close_redis()
+        try:
+            await drain_flush()
+        finally:
+            await close_db(); await close_redis()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     asyncio.run(main())
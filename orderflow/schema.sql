@@ -0,0 +1,92 @@
+-- Orderflow tables (TimescaleDB). Applied by the postgres container on first start.
+CREATE EXTENSION IF NOT EXISTS timescaledb;
+
+CREATE TABLE IF NOT EXISTS trade_agg_1s (
+    ts_1s     TIMESTAMPTZ      NOT NULL,
+    exchange  TEXT             NOT NULL,
+    symbol    TEXT             NOT NULL,
+    side      TEXT             NOT NULL,
+    volume    DOUBLE PRECISION NOT NULL,
+    vwap      DOUBLE PRECISION NOT NULL,
+    trades    INTEGER          NOT NULL,
+    min_price DOUBLE PRECISION NOT NULL,
+    max_price DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (ts_1s, exchange, symbol, side)
+);
+SELECT create_hypertable('trade_agg_1s', 'ts_1s', if_not_exists => TRUE);
+
+-- Rollups maintained by db_writer (utils/agg.py cascade): 1s -> 1m -> 5m -> 1h, merged on conflict.
+CREATE TABLE IF NOT EXISTS trade_agg_1m (
+    ts          TIMESTAMPTZ      NOT NULL,
+    exchange    TEXT             NOT NULL,
+    symbol      TEXT             NOT NULL,
+    volume      DOUBLE PRECISION NOT NULL,
+    buy_volume  DOUBLE PRECISION NOT NULL,
+    sell_volume DOUBLE PRECISION NOT NULL,
+    delta       DOUBLE PRECISION GENERATED ALWAYS AS (buy_volume - sell_volume) STORED,
+    vwap        DOUBLE PRECISION NOT NULL,
+    trades      BIGINT           NOT NULL,
+    min_price   DOUBLE PRECISION NOT NULL,
+    max_price   DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (ts, exchange, symbol)
+);
+SELECT create_hypertable('trade_agg_1m', 'ts', chunk_time_interval => INTERVAL '1 day', if_not_exists => TRUE);
+
+CREATE TABLE IF NOT EXISTS trade_agg_5m (
+    ts          TIMESTAMPTZ      NOT NULL,
+    exchange    TEXT             NOT NULL,
+    symbol      TEXT             NOT NULL,
+    volume      DOUBLE PRECISION NOT NULL,
+    buy_volume  DOUBLE PRECISION NOT NULL,
+    sell_volume DOUBLE PRECISION NOT NULL,
+    delta       DOUBLE PRECISION GENERATED ALWAYS AS (buy_volume - sell_volume) STORED,
+    vwap        DOUBLE PRECISION NOT NULL,
+    trades      BIGINT           NOT NULL,
+    min_price   DOUBLE PRECISION NOT NULL,
+    max_price   DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (ts, exchange, symbol)
+);
+SELECT create_hypertable('trade_agg_5m', 'ts', chunk_time_interval => INTERVAL '7 days', if_not_exists => TRUE);
+
+CREATE TABLE IF NOT EXISTS trade_agg_1h (
+    ts          TIMESTAMPTZ      NOT NULL,
+    exchange    TEXT             NOT NULL,
+    symbol      TEXT             NOT NULL,
+    volume      DOUBLE PRECISION NOT NULL,
+    buy_volume  DOUBLE PRECISION NOT NULL,
+    sell_volume DOUBLE PRECISION NOT NULL,
+    delta       DOUBLE PRECISION GENERATED ALWAYS AS (buy_volume - sell_volume) STORED,
+    vwap        DOUBLE PRECISION NOT NULL,
+    trades      BIGINT           NOT NULL,
+    min_price   DOUBLE PRECISION NOT NULL,
+    max_price   DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (ts, exchange, symbol)
+);
+SELECT create_hypertable('trade_agg_1h', 'ts', chunk_time_interval => INTERVAL '30 days', if_not_exists => TRUE);
+
+CREATE TABLE IF NOT EXISTS open_interest_history (
+    ts            TIMESTAMPTZ      NOT NULL,
+    exchange      TEXT             NOT NULL,
+    symbol        TEXT             NOT NULL,
+    open_interest DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (ts, exchange, symbol)
+);
+SELECT create_hypertable('open_interest_history', 'ts', if_not_exists => TRUE);
+
+-- One row per db_writer transaction, written inside it. `acks` (stream => entry ids) stays set until
+-- those entries are XACK'd: a writer re-reading its PEL or claiming a dead writer's entries skips the
+-- ones listed, so a crash between COMMIT and XACK does not merge them twice. `partial` (stream =>
+-- entry id => [[exchange, symbol, bucket start (s)]]) lists entries still pending whose trades below
+-- that second already committed; only their later trades are merged again. Both are cleared in the
+-- writer's next transaction, which lists the entries afresh. Rows are pruned after COMMIT_LOG_DAYS.
+CREATE TABLE IF NOT EXISTS writer_batches (
+    batch_id     TEXT        PRIMARY KEY,
+    consumer     TEXT        NOT NULL,
+    committed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    acks         JSONB,
+    partial      JSONB
+);
+ALTER TABLE writer_batches ADD COLUMN IF NOT EXISTS partial JSONB;
+DROP INDEX IF EXISTS writer_batches_unsettled;
+CREATE INDEX IF NOT EXISTS writer_batches_open ON writer_batches (batch_id) WHERE acks IS NOT NULL OR partial IS NOT NULL;
+CREATE INDEX IF NOT EXISTS writer_batches_committed_at ON writer_batches (committed_at);
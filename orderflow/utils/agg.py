@@ -1,35 +1,246 @@
-"""Trade aggregation to 1-second buckets."""
-from collections import defaultdict
+"""Trade aggregation to 1-second buckets.
+
+Open buckets live in a structure-of-arrays store (`trade_buckets`): one row slot per
+(exchange, symbol, side, bucket_start), with volume / px*qty / count / min / max held in
+NumPy columns. `add_trades` takes a whole batch as columns and aggregates it with a sort +
+`reduceat` group-by before touching the store; `add_trade` is the one-trade path.
+
+Closed 1s buckets are also folded into 1m → 5m → 1h rollups (`ROLLUP_SECS`), each level
+derived from the one below it. Rollups are emitted as deltas on every flush and merged by the
+upsert in `insert_trade_rollup`, so no open rollup state lives here and late trades land in
+the coarse levels the same way they land in the 1s table.
+
+Buckets are emitted once the event-time watermark of their (exchange, symbol) has passed
+their end: watermark = newest trade ts seen - ALLOWED_LATENESS_SEC (or wall clock - lateness
+once the symbol has been quiet for WATERMARK_IDLE_SEC). Trades arriving for an already
+emitted second open a fresh bucket that goes out on the next flush and is merged by the
+upsert in `insert_trade_agg_1s`.
+"""
+import time
 from datetime import datetime, timezone
-from settings import AGG_BUCKET_SEC
-
-# bucket_key => [vol, px_qty_sum, trades, min_px, max_px]
-trade_buckets = defaultdict(lambda: [0.0, 0.0, 0, float("inf"), 0.0])
-
-def add_trade(exchange:str, symbol:str, side:str, price:float, qty:float, ts_ms:int):
-    bucket_start = (ts_ms // 1000 // AGG_BUCKET_SEC) * AGG_BUCKET_SEC
-    k = (exchange, symbol, side, bucket_start)
-    bucket = trade_buckets[k]
-    bucket[0] += qty
-    bucket[1] += price * qty
-    bucket[2] += 1
-    bucket[3] = min(bucket[3], price)
-    bucket[4] = max(bucket[4], price)
-
-def flush_buckets():
-    """Yield and then clear current buckets."""
-    for (ex, sym, side, sec), (vol, pxqty, n, mn, mx) in list(trade_buckets.items()):
-        if vol == 0:
-            continue
+import numpy as np
+from settings import AGG_BUCKET_SEC, ALLOWED_LATENESS_SEC, WATERMARK_IDLE_SEC
+
+SIDES = ("buy", "sell")            # side code => name
+SIDE_CODE = {s: i for i, s in enumerate(SIDES)}
+ROLLUP_SECS = (60, 300, 3600)      # each level is folded from the one before it
+
+series = []        # series id => (exchange, symbol)
+_series_ids = {}   # (exchange, symbol) => series id
+
+# per series id, grown alongside `series`
+max_event_ms  = np.zeros(0, np.int64)    # newest trade ts seen
+last_seen     = np.zeros(0, np.float64)  # wall clock of the last batch for the series
+flushed_until = np.zeros(0, np.int64)    # bucket start (s) below which everything has been emitted
+
+def series_id(exchange:str, symbol:str) -> int:
+    """Dictionary-encode (exchange, symbol)."""
+    global max_event_ms, last_seen, flushed_until
+    sid = _series_ids.get((exchange, symbol))
+    if sid is None:
+        sid = _series_ids[(exchange, symbol)] = len(series)
+        series.append((exchange, symbol))
+        if sid >= len(max_event_ms):
+            grow = max(8, len(max_event_ms))
+            max_event_ms  = np.concatenate([max_event_ms, np.zeros(grow, np.int64)])
+            last_seen     = np.concatenate([last_seen, np.zeros(grow, np.float64)])
+            flushed_until = np.concatenate([flushed_until, np.zeros(grow, np.int64)])
+    return sid
+
+class BucketStore:
+    """Open buckets as parallel arrays; `slots` maps the packed bucket key to its row."""
+
+    def __init__(self, capacity:int=1024):
+        self.slots = {}  # (sid << 33 | side << 32 | bucket_start) => row
+        self.free = []
+        self.sid   = np.zeros(capacity, np.int32)
+        self.side  = np.zeros(capacity, np.int8)
+        self.sec   = np.zeros(capacity, np.int64)
+        self.vol   = np.zeros(capacity, np.float64)
+        self.pxqty = np.zeros(capacity, np.float64)
+        self.n     = np.zeros(capacity, np.int64)
+        self.mn    = np.full(capacity, np.inf)
+        self.mx    = np.full(capacity, -np.inf)
+        self.used  = np.zeros(capacity, bool)
+        self.top   = 0  # rows [0, top) have been handed out at least once
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, c).nbytes for c in ("sid", "side", "sec", "vol", "pxqty", "n", "mn", "mx", "used"))
+
+    def _grow(self):
+        cap = len(self.vol)
+        for col, fill in (("sid", 0), ("side", 0), ("sec", 0), ("vol", 0), ("pxqty", 0), ("n", 0),
+                          ("mn", np.inf), ("mx", -np.inf), ("used", False)):
+            old = getattr(self, col)
+            new = np.full(cap * 2, fill, old.dtype); new[:cap] = old
+            setattr(self, col, new)
+
+    def slot(self, key:int) -> int:
+        row = self.slots.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                if self.top == len(self.vol):
+                    self._grow()
+                row = self.top; self.top += 1
+            self.slots[key] = row
+            self.sid[row] = key >> 33; self.side[row] = (key >> 32) & 1; self.sec[row] = key & 0xFFFFFFFF
+            self.used[row] = True
+        return row
+
+    def release(self, rows:np.ndarray):
+        """Return rows to the free list and reset their accumulators."""
+        for r in rows.tolist():
+            del self.slots[int(self.sid[r]) << 33 | int(self.side[r]) << 32 | int(self.sec[r])]
+        self.free.extend(rows.tolist())
+        self.vol[rows] = 0; self.pxqty[rows] = 0; self.n[rows] = 0
+        self.mn[rows] = np.inf; self.mx[rows] = -np.inf; self.used[rows] = False
+
+trade_buckets = BucketStore()
+
+def _bucket_start(ts_ms):
+    return ts_ms // 1000 // AGG_BUCKET_SEC * AGG_BUCKET_SEC
+
+def _group(keys:np.ndarray):
+    """Sort order and group start offsets for equal `keys` (sort + reduceat group-by)."""
+    order = np.argsort(keys, kind="stable")
+    k = keys[order]
+    return order, k, np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+
+def add_trade(exchange:str, symbol:str, side:str, price:float, qty:float, ts_ms:int) -> int:
+    """Add one trade; returns its bucket start (s)."""
+    sid = series_id(exchange, symbol)
+    bucket_start = _bucket_start(ts_ms)
+    r = trade_buckets.slot(sid << 33 | SIDE_CODE[side] << 32 | bucket_start)
+    b = trade_buckets
+    b.vol[r] += qty
+    b.pxqty[r] += price * qty
+    b.n[r] += 1
+    if price < b.mn[r]: b.mn[r] = price
+    if price > b.mx[r]: b.mx[r] = price
+    if ts_ms > max_event_ms[sid]:
+        max_event_ms[sid] = ts_ms
+    last_seen[sid] = time.time()
+    return bucket_start
+
+def add_trades(batch:dict) -> np.ndarray:
+    """Aggregate a columnar batch and return each trade's bucket start (s).
+
+    `batch` holds equal-length arrays: "sid" (series ids from `series_id`), "side" (SIDE_CODE),
+    "px", "qty" (float64) and "ts" (epoch ms, int64).
+    """
+    sid = np.asarray(batch["sid"], np.int64); side = np.asarray(batch["side"], np.int64)
+    px = np.asarray(batch["px"], np.float64); qty = np.asarray(batch["qty"], np.float64)
+    ts = np.asarray(batch["ts"], np.int64)
+    secs = _bucket_start(ts)
+    if not len(ts):
+        return secs
+    order, k, starts = _group(sid << 33 | side << 32 | secs)
+    p, q = px[order], qty[order]
+    g_vol = np.add.reduceat(q, starts)
+    g_pxqty = np.add.reduceat(p * q, starts)
+    g_n = np.diff(np.r_[starts, len(k)])
+    g_mn = np.minimum.reduceat(p, starts)
+    g_mx = np.maximum.reduceat(p, starts)
+
+    b = trade_buckets
+    rows = np.fromiter((b.slot(key) for key in k[starts].tolist()), np.int64, len(starts))
+    b.vol[rows] += g_vol
+    b.pxqty[rows] += g_pxqty
+    b.n[rows] += g_n
+    b.mn[rows] = np.minimum(b.mn[rows], g_mn)
+    b.mx[rows] = np.maximum(b.mx[rows], g_mx)
+    np.maximum.at(max_event_ms, sid, ts)
+    last_seen[np.unique(sid)] = time.time()
+    return secs
+
+def watermarks(now:float | None = None) -> np.ndarray:
+    """Per series id: bucket start (s) below which its buckets are considered closed."""
+    now = time.time() if now is None else now
+    n = len(series)
+    wm = max_event_ms[:n] / 1000 - ALLOWED_LATENESS_SEC
+    idle = now - last_seen[:n] >= WATERMARK_IDLE_SEC
+    wm[idle] = np.maximum(wm[idle], now - ALLOWED_LATENESS_SEC)
+    return (wm // AGG_BUCKET_SEC * AGG_BUCKET_SEC).astype(np.int64)
+
+def watermark(exchange:str, symbol:str, now:float | None = None) -> int:
+    return int(watermarks(now)[series_id(exchange, symbol)])
+
+def is_flushed(sid, bucket_start):
+    """True once the bucket has gone out in a flush (so the trades in it may be acked); vectorises."""
+    return bucket_start < flushed_until[sid]
+
+def drain_closed(force:bool=False) -> dict:
+    """Remove closed buckets (all of them when `force`) from the store and return them as columns."""
+    b = trade_buckets
+    # a late trade can open a bucket below flushed_until (the wall-clock watermark of an idle series ran ahead of
+    # its event time); it already counts as flushed for acking, so it must go out with this drain too
+    wms = np.maximum(watermarks(), flushed_until[:len(series)])
+    live = b.used[:b.top]
+    rows = np.flatnonzero(live if force else live & (b.sec[:b.top] < wms[b.sid[:b.top]]))
+    out = {c: getattr(b, c)[rows].copy() for c in ("sid", "side", "sec", "vol", "pxqty", "n", "mn", "mx")}
+    b.release(rows)
+    if force and len(series):
+        wms = np.maximum(wms, (max_event_ms[:len(series)] // 1000 // AGG_BUCKET_SEC + 1) * AGG_BUCKET_SEC)
+    np.maximum(flushed_until[:len(series)], wms, out=flushed_until[:len(series)])
+    return out
+
+def bucket_records(cols:dict) -> list:
+    """Drained 1s columns => tuples in `utils.db.TRADE_AGG_COLS` order."""
+    keep = cols["vol"] > 0
+    c = {k: v[keep] for k, v in cols.items()}
+    return [(datetime.fromtimestamp(sec, tz=timezone.utc), *series[sid], SIDES[side], vol, pxqty / vol, n, mn, mx)
+            for sid, side, sec, vol, pxqty, n, mn, mx in zip(*(c[k].tolist() for k in ("sid", "side", "sec", "vol", "pxqty", "n", "mn", "mx")))]
+
+def rollup(cols:dict, step:int) -> dict:
+    """Fold finer bucket columns into `step`-second buckets per series (sides merged, buy volume kept)."""
+    buy = cols["buy_vol"] if "buy_vol" in cols else np.where(cols["side"] == 0, cols["vol"], 0.0)
+    if not len(buy):
+        return {c: np.zeros(0, np.int64 if c in ("sid", "sec", "n") else np.float64)
+                for c in ("sid", "sec", "vol", "buy_vol", "pxqty", "n", "mn", "mx")}
+    sec = cols["sec"] // step * step
+    order, k, starts = _group(cols["sid"].astype(np.int64) << 32 | sec)
+    return {
+        "sid": k[starts] >> 32, "sec": k[starts] & 0xFFFFFFFF,
+        "vol": np.add.reduceat(cols["vol"][order], starts),
+        "buy_vol": np.add.reduceat(buy[order], starts),
+        "pxqty": np.add.reduceat(cols["pxqty"][order], starts),
+        "n": np.add.reduceat(cols["n"][order], starts),
+        "mn": np.minimum.reduceat(cols["mn"][order], starts),
+        "mx": np.maximum.reduceat(cols["mx"][order], starts),
+    }
+
+def cascade(cols:dict) -> list:
+    """[(step, rollup columns)] for every level in ROLLUP_SECS, each built from the previous one."""
+    out = []
+    for step in ROLLUP_SECS:
+        cols = rollup(cols, step)
+        out.append((step, cols))
+    return out
+
+def rollup_records(cols:dict) -> list:
+    """Rollup columns => tuples in `utils.db.ROLLUP_COLS` order."""
+    keep = cols["vol"] > 0
+    c = {k: v[keep] for k, v in cols.items()}
+    return [(datetime.fromtimestamp(sec, tz=timezone.utc), *series[sid], vol, buy, vol - buy, pxqty / vol, n, mn, mx)
+            for sid, sec, vol, buy, pxqty, n, mn, mx in zip(*(c[k].tolist() for k in ("sid", "sec", "vol", "buy_vol", "pxqty", "n", "mn", "mx")))]
+
+def flush_buckets(force:bool=False):
+    """Yield and then clear closed buckets (all of them when `force`)."""
+    for ts, ex, sym, side, vol, vwap, n, mn, mx in bucket_records(drain_closed(force)):
         yield {
-            "ts": datetime.fromtimestamp(sec, tz=timezone.utc),
+            "ts": ts,
             "exchange": ex,
             "symbol": sym,
             "side": side,
             "volume": vol,
-            "vwap": pxqty / vol,
+            "vwap": vwap,
             "trades": n,
             "min_price": mn,
             "max_price": mx,
         }
-        del trade_buckets[(ex, sym, side, sec)]
@@ -0,0 +1,204 @@
+"""Incremental L2 order books synced from exchange snapshot + diff streams.
+
+Each side is a pair of parallel float64 arrays (price, qty) kept ascending by price, so the
+best bid is the last level and the best ask the first; a diff message is applied as one
+`searchsorted` for every level it touches (in-place qty updates, one `np.insert` for new
+levels, one mask for deletions). Features (spread, top-N imbalance, depth within ±x% of
+mid) are computed from the arrays on demand; nothing per-diff is published.
+
+Sequencing, no I/O here (the collector drives it):
+
+  * Binance futures (`<sym>@depth@100ms`): diffs are buffered until the REST snapshot
+    (`lastUpdateId` L) is loaded; diffs with u < L are dropped, the first applied one must
+    have U <= L <= u, and every later one must have pu == the previous u. A break marks
+    the book unsynced and asks for a new snapshot.
+  * Bybit v5 (`orderbook.<depth>.<sym>`): a "snapshot" message (re)loads the book; each
+    "delta" must carry u == previous u + 1. A break raises `BookGap`, so the socket is
+    dropped and the resubscribe delivers a fresh snapshot.
+"""
+import struct
+from collections import deque
+import numpy as np
+
+SNAP_VERSION = 1
+_SNAP_HEAD = struct.Struct("<BqqHH")  # version, ts ms, update id, n bids, n asks
+
+class BookGap(Exception):
+    """The diff stream skipped an update; the book must be rebuilt from a snapshot."""
+
+def levels(rows) -> tuple:
+    """[[price, qty], ...] (strings or numbers) => (px, qty) float64 arrays."""
+    n = len(rows)
+    return (np.fromiter((float(r[0]) for r in rows), np.float64, n),
+            np.fromiter((float(r[1]) for r in rows), np.float64, n))
+
+class BookSide:
+    """Price levels of one side, ascending by price; qty 0 never stays in the arrays."""
+    __slots__ = ("px", "qty")
+
+    def __init__(self):
+        self.px = np.zeros(0, np.float64)
+        self.qty = np.zeros(0, np.float64)
+
+    def __len__(self):
+        return len(self.px)
+
+    def load(self, px:np.ndarray, qty:np.ndarray):
+        keep = qty > 0
+        order = np.argsort(px[keep], kind="stable")
+        self.px, self.qty = px[keep][order], qty[keep][order]
+
+    def apply(self, px:np.ndarray, qty:np.ndarray):
+        """Set the qty of each price (0 removes the level); a later entry for the same price wins."""
+        if not len(px):
+            return
+        if len(px) > 1:
+            order = np.argsort(px, kind="stable")
+            px, qty = px[order], qty[order]
+            last = np.empty(len(px), bool)
+            last[:-1] = px[1:] != px[:-1]; last[-1] = True
+            if not last.all():
+                px, qty = px[last], qty[last]
+        i = np.searchsorted(self.px, px)
+        hit = i < len(self.px)
+        hit[hit] = self.px[i[hit]] == px[hit]
+        if hit.any():
+            self.qty[i[hit]] = qty[hit]
+        new = ~hit & (qty > 0)
+        if new.any():
+            self.px = np.insert(self.px, i[new], px[new])
+            self.qty = np.insert(self.qty, i[new], qty[new])
+        if hit.any() and (qty[hit] == 0).any():
+            keep = self.qty > 0
+            self.px, self.qty = self.px[keep], self.qty[keep]
+
+    def trim(self, n:int, keep_high:bool):
+        """Keep the `n` levels nearest the touch (the highest bids / lowest asks)."""
+        if len(self.px) > n:
+            s = slice(-n, None) if keep_high else slice(None, n)
+            self.px, self.qty = self.px[s].copy(), self.qty[s].copy()
+
+class OrderBook:
+    """One symbol's L2 book. `update_id` is None until the book is synced."""
+
+    def __init__(self, exchange:str, symbol:str, max_levels:int=5000):
+        self.exchange, self.symbol, self.max_levels = exchange, symbol, max_levels
+        self.bids, self.asks = BookSide(), BookSide()
+        self.update_id = None
+        self.ts = 0            # exchange event time (ms) of the last update
+        self.resyncs = 0
+        self.on_resync = None  # optional callback(book, reason) when the book loses sync
+
+    @property
+    def synced(self) -> bool:
+        return self.update_id is not None
+
+    def load(self, bids, asks, update_id:int, ts:int):
+        self.bids.load(*levels(bids)); self.asks.load(*levels(asks))
+        self.update_id, self.ts = update_id, ts
+
+    def apply(self, bids, asks, update_id:int, ts:int):
+        self.bids.apply(*levels(bids)); self.asks.apply(*levels(asks))
+        self.update_id, self.ts = update_id, ts
+        # levels far from the touch only ever grow (and fall outside the snapshot depth); cap them with slack
+        if len(self.bids) > self.max_levels * 5 // 4:
+            self.bids.trim(self.max_levels, keep_high=True)
+        if len(self.asks) > self.max_levels * 5 // 4:
+            self.asks.trim(self.max_levels, keep_high=False)
+
+    def lost_sync(self, reason:str):
+        self.update_id = None
+        self.resyncs += 1
+        if self.on_resync:
+            self.on_resync(self, reason)
+
+    def top(self, n:int) -> tuple:
+        """(bid px, bid qty, ask px, ask qty), best first, at most `n` levels each."""
+        return self.bids.px[::-1][:n], self.bids.qty[::-1][:n], self.asks.px[:n], self.asks.qty[:n]
+
+    def features(self, top_n:int=10, depth_pct:tuple=(0.001, 0.005, 0.01)) -> dict | None:
+        """Touch, spread, top-N qty imbalance in [-1, 1] and qty within ±pct of mid per side; None if
+        a side is empty or the book is crossed."""
+        if not len(self.bids) or not len(self.asks):
+            return None
+        bid, ask = float(self.bids.px[-1]), float(self.asks.px[0])
+        if bid >= ask:
+            return None
+        mid = (bid + ask) / 2
+        bq, aq = float(self.bids.qty[-top_n:].sum()), float(self.asks.qty[:top_n].sum())
+        out = {"bid": bid, "ask": ask, "bid_qty": float(self.bids.qty[-1]), "ask_qty": float(self.asks.qty[0]),
+               "spread": ask - bid, "spread_bp": (ask - bid) / mid * 1e4, "imbalance": (bq - aq) / (bq + aq)}
+        for p in depth_pct:
+            bp = round(p * 1e4)
+            out[f"bid_depth_{bp}bp"] = float(self.bids.qty[np.searchsorted(self.bids.px, mid * (1 - p)):].sum())
+            out[f"ask_depth_{bp}bp"] = float(self.asks.qty[:np.searchsorted(self.asks.px, mid * (1 + p), "right")].sum())
+        return out
+
+    def pack(self, n:int) -> bytes:
+        """Top `n` levels per side, little-endian: head | f64 bid px[nb] | bid qty[nb] | ask px[na] | ask qty[na]."""
+        bp, bq, ap, aq = self.top(n)
+        return b"".join((_SNAP_HEAD.pack(SNAP_VERSION, self.ts, self.update_id or 0, len(bp), len(ap)),
+                         bp.tobytes(), bq.tobytes(), ap.tobytes(), aq.tobytes()))
+
+def unpack(buf:bytes) -> dict:
+    """`OrderBook.pack` payload => {"ts", "update_id", "bid_px", "bid_qty", "ask_px", "ask_qty"} (best first)."""
+    version, ts, uid, nb, na = _SNAP_HEAD.unpack_from(buf, 0)
+    if version != SNAP_VERSION:
+        raise ValueError(f"unsupported book snapshot version {version}")
+    off, out = _SNAP_HEAD.size, {"ts": ts, "update_id": uid}
+    for name, n in (("bid_px", nb), ("bid_qty", nb), ("ask_px", na), ("ask_qty", na)):
+        out[name] = np.frombuffer(buf, np.float64, n, off); off += n * 8
+    return out
+
+class BinanceBook(OrderBook):
+    """Binance USDⓈ-M / COIN-M diff-depth sync. `on_diff` returns True while a REST snapshot is needed."""
+
+    def __init__(self, exchange:str, symbol:str, max_levels:int=5000, max_buffer:int=2000):
+        super().__init__(exchange, symbol, max_levels)
+        self.buffer = deque(maxlen=max_buffer)  # diffs seen while unsynced
+        self.snapshot_id = None                 # lastUpdateId of a loaded snapshot not yet bridged by a diff
+
+    @property
+    def need_snapshot(self) -> bool:
+        return self.update_id is None and self.snapshot_id is None
+
+    def on_diff(self, d:dict) -> bool:
+        if self.update_id is not None:
+            if d["pu"] == self.update_id:
+                self.apply(d["b"], d["a"], d["u"], d["E"])
+                return False
+            self.lost_sync(f"pu {d['pu']} != last u {self.update_id}")
+        elif self.snapshot_id is not None:
+            if d["u"] < self.snapshot_id:
+                return False  # already in the snapshot
+            if d["U"] <= self.snapshot_id:
+                self.snapshot_id = None
+                self.apply(d["b"], d["a"], d["u"], d["E"])
+                return False
+            self.lost_sync(f"snapshot {self.snapshot_id} older than first diff U {d['U']}")
+            self.snapshot_id = None
+        self.buffer.append(d)
+        return True
+
+    def on_snapshot(self, snap:dict) -> bool:
+        """Load a REST depth snapshot and replay the buffered diffs over it; False if another snapshot is needed."""
+        self.load(snap["bids"], snap["asks"], None, snap.get("E", 0))
+        self.snapshot_id = snap["lastUpdateId"]
+        buffered, self.buffer = list(self.buffer), deque(maxlen=self.buffer.maxlen)
+        for d in buffered:
+            self.on_diff(d)
+        return not self.need_snapshot
+
+class BybitBook(OrderBook):
+    """Bybit v5 orderbook topic sync: snapshots reload, deltas must be consecutive in `u`."""
+
+    def on_message(self, m:dict):
+        d = m["data"]
+        if m["type"] == "snapshot":
+            self.load(d["b"], d["a"], d["u"], m["ts"])
+        elif self.update_id is not None:
+            if d["u"] != self.update_id + 1:
+                last = self.update_id
+                self.lost_sync(f"u {d['u']} after {last}")
+                raise BookGap(f"bybit {self.symbol}: u {d['u']} after {last}")
+            self.apply(d["b"], d["a"], d["u"], m["ts"])
@@ -0,0 +1,88 @@
+"""Packed, versioned trade batches for the orderflow Redis streams.
+
+A packed entry carries many trades: fields {"v": b"1", "b": payload}, payload little-endian
+
+    u8 version | u16 n_series | n_series x (u8 len + exchange, u8 len + symbol) | u32 n
+    | i64 ts[n] | f64 px[n] | f64 qty[n] | u16 series[n] | u8 side[n]
+
+with exchange/symbol dictionary-encoded per entry. Entries without "v" are the legacy
+one-trade-per-entry string format (ex, sym, side, px, qty, ts) and still decode, so writers
+can be upgraded before collectors.
+"""
+import struct
+import numpy as np
+from utils.agg import SIDE_CODE
+
+VERSION = 1
+_HEAD = struct.Struct("<BH")
+_COLS = (("ts", np.int64), ("px", np.float64), ("qty", np.float64), ("series", np.uint16), ("side", np.uint8))
+
+def _s(v):
+    return v.decode() if isinstance(v, bytes) else v
+
+def encode_trades(trades:list) -> dict:
+    """Trade dicts (ex, sym, side, px, qty, ts; numbers may be strings) => one packed stream entry."""
+    series, codes = {}, []
+    for t in trades:
+        codes.append(series.setdefault((t["ex"], t["sym"]), len(series)))
+    parts = [_HEAD.pack(VERSION, len(series))]
+    for ex, sym in series:
+        for name in (ex.encode(), sym.encode()):
+            parts += [bytes((len(name),)), name]
+    parts.append(struct.pack("<I", len(trades)))
+    parts.append(np.fromiter((int(t["ts"]) for t in trades), np.int64, len(trades)).tobytes())
+    parts.append(np.fromiter((float(t["px"]) for t in trades), np.float64, len(trades)).tobytes())
+    parts.append(np.fromiter((float(t["qty"]) for t in trades), np.float64, len(trades)).tobytes())
+    parts.append(np.array(codes, np.uint16).tobytes())
+    parts.append(np.fromiter((SIDE_CODE[t["side"]] for t in trades), np.uint8, len(trades)).tobytes())
+    return {"v": str(VERSION), "b": b"".join(parts)}
+
+def decode_payload(buf:bytes):
+    """Packed payload => ([(exchange, symbol)], {"ts", "px", "qty", "series", "side": arrays}) without copying."""
+    version, n_series = _HEAD.unpack_from(buf, 0)
+    if version != VERSION:
+        raise ValueError(f"unsupported trade batch version {version}")
+    off, series = _HEAD.size, []
+    for _ in range(n_series):
+        names = []
+        for _ in range(2):
+            ln = buf[off]; names.append(buf[off + 1:off + 1 + ln].decode()); off += 1 + ln
+        series.append(tuple(names))
+    (n,), off = struct.unpack_from("<I", buf, off), off + 4
+    cols = {}
+    for name, dt in _COLS:
+        cols[name] = np.frombuffer(buf, dt, n, off); off += n * np.dtype(dt).itemsize
+    return series, cols
+
+def decode_entries(entries, series_id) -> dict:
+    """A stream batch [(msg_id, fields)] => one columnar trade batch for `agg.add_trades`.
+
+    `series_id(exchange, symbol)` interns names; the result carries "sid", "side", "px", "qty",
+    "ts" and "entry" (index into `entries` of each trade's message) for ack bookkeeping.
+    """
+    out = {k: [] for k in ("sid", "side", "px", "qty", "ts", "entry")}
+    legacy = []
+    for i, (_, f) in enumerate(entries):
+        if not f:
+            continue
+        v = f.get(b"v", f.get("v"))
+        if v is None:
+            legacy.append((i, f))
+            continue
+        if int(v) != VERSION:
+            raise ValueError(f"unsupported trade batch version {_s(v)}")
+        series, cols = decode_payload(f.get(b"b", f.get("b")))
+        lut = np.array([series_id(*s) for s in series], np.int32)
+        out["sid"].append(lut[cols["series"]]); out["side"].append(cols["side"])
+        out["px"].append(cols["px"]); out["qty"].append(cols["qty"]); out["ts"].append(cols["ts"])
+        out["entry"].append(np.full(len(cols["ts"]), i, np.int64))
+    if legacy:
+        g = lambda f, k: _s(f.get(k.encode(), f.get(k)))
+        out["sid"].append(np.array([series_id(g(f, "ex"), g(f, "sym")) for _, f in legacy], np.int32))
+        out["side"].append(np.array([SIDE_CODE[g(f, "side")] for _, f in legacy], np.uint8))
+        out["px"].append(np.array([float(g(f, "px")) for _, f in legacy]))
+        out["qty"].append(np.array([float(g(f, "qty")) for _, f in legacy]))
+        out["ts"].append(np.array([int(g(f, "ts")) for _, f in legacy], np.int64))
+        out["entry"].append(np.array([i for i, _ in legacy], np.int64))
+    dtypes = {"sid": np.int32, "side": np.uint8, "px": np.float64, "qty": np.float64, "ts": np.int64, "entry": np.int64}
+    return {k: np.concatenate(v) if v else np.zeros(0, dtypes[k]) for k, v in out.items()}
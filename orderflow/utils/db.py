@@ -1,8 +1,32 @@
+import json, math
+from datetime import datetime, timezone
 import asyncpg
 from settings import PG_DSN
 
 pg_pool = None  # type: asyncpg.pool.Pool | None
 
+TRADE_AGG_COLS = ("ts_1s", "exchange", "symbol", "side", "volume", "vwap", "trades", "min_price", "max_price")
+ROLLUP_COLS    = ("ts", "exchange", "symbol", "volume", "buy_volume", "sell_volume", "vwap", "trades", "min_price", "max_price")
+ROLLUP_TABLES  = {60: "trade_agg_1m", 300: "trade_agg_5m", 3600: "trade_agg_1h"}
+OI_COLS        = ("ts", "exchange", "symbol", "open_interest")
+COPY_MIN_ROWS  = 64  # below this a staging table costs more than it saves
+
+# Several writers (and redelivered messages) can produce partial aggregates for the same bucket: merge, don't drop.
+TRADE_AGG_MERGE = """(ts_1s, exchange, symbol, side) DO UPDATE SET
+    vwap      = (t.vwap * t.volume + EXCLUDED.vwap * EXCLUDED.volume) / NULLIF(t.volume + EXCLUDED.volume, 0),
+    volume    = t.volume + EXCLUDED.volume,
+    trades    = t.trades + EXCLUDED.trades,
+    min_price = LEAST(t.min_price, EXCLUDED.min_price),
+    max_price = GREATEST(t.max_price, EXCLUDED.max_price)"""
+ROLLUP_MERGE = """(ts, exchange, symbol) DO UPDATE SET
+    vwap        = (t.vwap * t.volume + EXCLUDED.vwap * EXCLUDED.volume) / NULLIF(t.volume + EXCLUDED.volume, 0),
+    volume      = t.volume + EXCLUDED.volume,
+    buy_volume  = t.buy_volume + EXCLUDED.buy_volume,
+    sell_volume = t.sell_volume + EXCLUDED.sell_volume,
+    trades      = t.trades + EXCLUDED.trades,
+    min_price   = LEAST(t.min_price, EXCLUDED.min_price),
+    max_price   = GREATEST(t.max_price, EXCLUDED.max_price)"""
+
 async def init_db():
     global pg_pool
     pg_pool = await asyncpg.create_pool(dsn=PG_DSN, min_size=2, max_size=10)
@@ -11,4 +35,109 @@ async def close_db():
     if pg_pool is not None:
         await pg_pool.close()
 
-# TODO: add concrete insert helpers (`insert_open_interest`, `insert_trade_agg_1s`, etc.).
+async def _bulk_insert(conn, table:str, cols:tuple, records:list, on_conflict:str="DO NOTHING"):
+    """Write `records` (tuples in `cols` order) with one INSERT … SELECT.
+
+    Large batches are COPY'd into a per-session temp staging table first, small ones go through
+    `executemany` on a single prepared statement. Either way it is one transaction.
+    """
+    if not records:
+        return 0
+    col_sql = ",".join(cols)
+    async with conn.transaction():
+        if len(records) < COPY_MIN_ROWS:
+            params = ",".join(f"${i}" for i in range(1, len(cols) + 1))
+            await conn.executemany(f"INSERT INTO {table} AS t ({col_sql}) VALUES ({params}) ON CONFLICT {on_conflict}", records)
+            return len(records)
+        stg = f"_stg_{table}"
+        await conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stg} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        await conn.copy_records_to_table(stg, records=records, columns=cols)
+        await conn.execute(f"INSERT INTO {table} AS t ({col_sql}) SELECT {col_sql} FROM {stg} ON CONFLICT {on_conflict}")
+        await conn.execute(f"TRUNCATE {stg}")  # the caller's outer transaction may stage again before commit
+    return len(records)
+
+async def insert_trade_agg_1s(conn, records:list, table:str="trade_agg_1s"):
+    """Bulk upsert 1-second trade aggregates; `records` follow TRADE_AGG_COLS and must be unique per bucket."""
+    return await _bulk_insert(conn, table, TRADE_AGG_COLS, records, on_conflict=TRADE_AGG_MERGE)
+
+async def insert_trade_rollup(conn, step:int, records:list):
+    """Merge rollup deltas (ROLLUP_COLS order) into the `step`-second table."""
+    return await _bulk_insert(conn, ROLLUP_TABLES[step], ROLLUP_COLS, records, on_conflict=ROLLUP_MERGE)
+
+# writer_batches: one row per db_writer transaction; `acks` (stream => entry ids) and `partial` (stream => entry id
+# => [[exchange, symbol, bucket start]]) set until the writer's next transaction
+async def record_batch(conn, batch_id:str, consumer:str, acks:dict | None, partial:dict | None = None) -> bool:
+    """Log a batch inside the transaction that writes it; False if `batch_id` already committed."""
+    return await conn.fetchval(
+        "INSERT INTO writer_batches (batch_id, consumer, acks, partial) VALUES ($1, $2, $3::jsonb, $4::jsonb) "
+        "ON CONFLICT DO NOTHING RETURNING true",
+        batch_id, consumer, json.dumps(acks) if acks else None, json.dumps(partial) if partial else None) is not None
+
+async def settle_batches(conn, batch_ids:list):
+    """Forget the entries of batches whose XACK went through (the current transaction lists what is still pending)."""
+    if batch_ids:
+        await conn.execute("UPDATE writer_batches SET acks = NULL, partial = NULL WHERE batch_id = ANY($1::text[])", batch_ids)
+
+async def fetch_unsettled_acks(conn) -> tuple:
+    """(stream => ids of entries whose rows all committed but which may not have been XACK'd,
+        stream => entry id => {(exchange, symbol): bucket start (s) below which its trades committed})."""
+    acks, partial = {}, {}
+    for r in await conn.fetch("SELECT acks, partial FROM writer_batches WHERE acks IS NOT NULL OR partial IS NOT NULL"):
+        for stream, ids in json.loads(r["acks"] or "{}").items():
+            acks.setdefault(stream, set()).update(ids)
+        for stream, entries in json.loads(r["partial"] or "{}").items():
+            for msg_id, through in entries.items():
+                d = partial.setdefault(stream, {}).setdefault(msg_id, {})
+                for ex, sym, sec in through:
+                    d[ex, sym] = max(d.get((ex, sym), sec), sec)
+    return acks, partial
+
+async def prune_batches(conn, keep_days:int):
+    """Drop log rows older than `keep_days`, settled or not (a crashed writer never settles its last batch)."""
+    await conn.execute("DELETE FROM writer_batches WHERE committed_at < now() - make_interval(days => $1)", keep_days)
+
+# the rows of one table as rollup columns; trade_agg_1s splits volume by side
+_BAR_ROWS = {1: "SELECT ts_1s AS ts, volume, CASE WHEN side = 'buy' THEN volume ELSE 0 END AS buy_volume, "
+                "CASE WHEN side = 'sell' THEN volume ELSE 0 END AS sell_volume, vwap, trades, min_price, max_price "
+                "FROM trade_agg_1s WHERE exchange = $2 AND symbol = $3 AND ts_1s >= ${} AND ts_1s < ${}",
+             **{step: f"SELECT ts, volume, buy_volume, sell_volume, vwap, trades, min_price, max_price FROM {table} "
+                      "WHERE exchange = $2 AND symbol = $3 AND ts >= ${} AND ts < ${}" for step, table in ROLLUP_TABLES.items()}}
+
+def _bar_spans(start:datetime, end:datetime, step:int) -> list:
+    """[(step, lo, hi)] covering [start, end): whole `step` buckets from that table, the unaligned head and tail
+    (a partial coarse row would reach outside the window) from the next finer table that divides it."""
+    if start >= end:
+        return []
+    if step == 1:
+        return [(1, start, end)]
+    finer = max(s for s in (1, *ROLLUP_TABLES) if s < step and step % s == 0)
+    a, b = math.ceil(start.timestamp() / step) * step, math.floor(end.timestamp() / step) * step
+    if a >= b:
+        return _bar_spans(start, end, finer)
+    a, b = datetime.fromtimestamp(a, timezone.utc), datetime.fromtimestamp(b, timezone.utc)
+    return [*_bar_spans(start, a, finer), (step, a, b), *_bar_spans(b, end, finer)]
+
+async def fetch_trade_bars(conn, exchange:str, symbol:str, start:datetime, end:datetime, bucket_sec:int):
+    """Volume/VWAP/delta bars of `bucket_sec` over [start, end), read from the coarsest table that divides it
+    (finer tables fill in where the window is not aligned to that table's step)."""
+    step = max((s for s in (1, *ROLLUP_TABLES) if bucket_sec % s == 0), default=1)
+    start, end = (t if t.tzinfo else t.replace(tzinfo=timezone.utc) for t in (start, end))  # naive = UTC, as Postgres reads it
+    spans = _bar_spans(start, end, step)
+    if not spans:
+        return []
+    rows = " UNION ALL ".join(_BAR_ROWS[s].format(4 + 2 * i, 5 + 2 * i) for i, (s, _, _) in enumerate(spans))
+    return await conn.fetch(
+        f"""
+        SELECT time_bucket(make_interval(secs => $1), ts) AS ts,
+               sum(volume) AS volume, coalesce(sum(buy_volume), 0) AS buy_volume, coalesce(sum(sell_volume), 0) AS sell_volume,
+               sum(vwap * volume) / NULLIF(sum(volume), 0) AS vwap, sum(trades) AS trades,
+               min(min_price) AS min_price, max(max_price) AS max_price
+        FROM ({rows}) r
+        GROUP BY 1 ORDER BY 1
+        """,
+        bucket_sec, exchange, symbol, *(t for _, lo, hi in spans for t in (lo, hi)),
+    )
+
+async def insert_open_interest(conn, records:list, table:str="open_interest_history"):
+    """Bulk insert OI samples; `records` follow OI_COLS."""
+    return await _bulk_insert(conn, table, OI_COLS, records)
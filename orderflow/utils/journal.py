@@ -0,0 +1,66 @@
+"""Local on-disk spill for flush batches that could not be written to Postgres.
+
+One JSON file per batch under JOURNAL_DIR, written to a temp name, fsync'd and renamed, so a
+crash leaves either a whole batch or none. Files are named by a monotonically increasing
+sequence and replayed oldest first once Postgres is back. A batch is
+{"id": batch id, "trade_agg_1s": rows, "rollups": [[step, rows]], "open_interest": rows} with rows
+in the `utils.db` column order; the leading timestamp of every row is stored as epoch seconds.
+A batch Postgres keeps rejecting is renamed to *.bad and no longer replayed.
+"""
+import json, os, time
+from datetime import datetime, timezone
+from pathlib import Path
+
+KINDS = ("trade_agg_1s", "open_interest")
+
+def _dump_rows(rows):
+    return [[r[0].timestamp(), *r[1:]] for r in rows]
+
+def _load_rows(rows):
+    return [(datetime.fromtimestamp(r[0], tz=timezone.utc), *r[1:]) for r in rows]
+
+class Journal:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._seq = time.time_ns()
+
+    def __len__(self):
+        return sum(1 for _ in self.root.glob("*.json"))
+
+    def write(self, batch:dict) -> Path:
+        """Persist the id and rows of `batch` (other keys, e.g. "acks", are not journaled)."""
+        doc = {k: _dump_rows(batch[k]) for k in KINDS}
+        if "id" in batch:
+            doc["id"] = batch["id"]
+        doc["rollups"] = [[step, _dump_rows(rows)] for step, rows in batch["rollups"]]
+        self._seq = max(self._seq + 1, time.time_ns())
+        path = self.root / f"{self._seq:020d}.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as fh:
+            json.dump(doc, fh, separators=(",", ":"))
+            fh.flush(); os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def oldest(self, n:int | None = None) -> list:
+        files = sorted(self.root.glob("*.json"))
+        return files if n is None else files[:n]
+
+    def read(self, path:Path) -> dict:
+        with open(path) as fh:
+            doc = json.load(fh)
+        batch = {k: _load_rows(doc[k]) for k in KINDS}
+        batch["rollups"] = [(step, _load_rows(rows)) for step, rows in doc["rollups"]]
+        if "id" in doc:
+            batch["id"] = doc["id"]
+        return batch
+
+    def remove(self, path:Path):
+        path.unlink(missing_ok=True)
+
+    def quarantine(self, path:Path) -> Path:
+        """Set a batch aside as *.bad: kept for inspection, skipped by `oldest` and `len`."""
+        bad = path.with_suffix(".bad")
+        os.replace(path, bad)
+        return bad
@@ -0,0 +1,200 @@
+"""In-process counters, gauges and histograms with Prometheus text exposition.
+
+    from utils import metrics
+    FLUSH_SEC = metrics.histogram("orderflow_flush_seconds", "flush_to_db duration")
+    with FLUSH_SEC.time(): ...
+    metrics.start(port=9108, log_every=60)   # /metrics on :9108 and/or a JSON snapshot in the log
+
+Dependency-free (no settings import either), so bina_VL uses the same module as
+`orderflow.utils.metrics`. Updates take one small lock; instrument per batch or per request,
+and use `Sampler` for anything that happens per trade.
+"""
+import bisect, json, logging, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_registry = {}
+_lock = threading.Lock()
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(names, values, extra=""):
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name:str, help:str, labels:tuple=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels:dict):
+        return tuple(labels[n] for n in self.labels)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, n:float=1, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0) + n
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}_total{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+    def snapshot(self):
+        with self._lock:
+            return {",".join(map(str, k)) or "": v for k, v in self._values.items()}
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, v:float, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = v
+
+    def expose(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str, labels:tuple=(), buckets:tuple=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, v:float, **labels):
+        k = self._key(labels)
+        i = bisect.bisect_left(self.buckets, v)
+        with self._lock:
+            st = self._values.get(k)
+            if st is None:
+                st = self._values[k] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            st[0][i] += 1; st[1] += v; st[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t, **labels)
+
+    def expose(self):
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        out = self._header()
+        for k, (counts, total, n) in items:
+            cum = 0
+            for le, c in zip((*self.buckets, "+Inf"), counts):
+                cum += c
+                bound = f'le="{le}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, k, bound)} {cum}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {total}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {n}")
+        return out
+
+    def quantile(self, q:float, **labels):
+        """Upper bucket bound holding the q-quantile (coarse; for log snapshots)."""
+        with self._lock:
+            st = self._values.get(self._key(labels))
+            counts, n = (list(st[0]), st[2]) if st else ([], 0)
+        if not n:
+            return None
+        cum = 0
+        for le, c in zip((*self.buckets, float("inf")), counts):
+            cum += c
+            if cum >= q * n:
+                return le
+
+    def snapshot(self):
+        with self._lock:
+            keys = [(k, st[1], st[2]) for k, st in self._values.items()]
+        return {",".join(map(str, k)) or "": {"count": n, "mean": total / n if n else 0.0,
+                                              "p50": self.quantile(.5, **dict(zip(self.labels, k))),
+                                              "p99": self.quantile(.99, **dict(zip(self.labels, k)))}
+                for k, total, n in keys}
+
+def _register(cls, name, *args, **kw):
+    with _lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = cls(name, *args, **kw)
+        elif type(m) is not cls:
+            raise ValueError(f"metric {name} already registered as {m.kind}")
+        return m
+
+def counter(name:str, help:str, labels:tuple=()) -> Counter:
+    return _register(Counter, name, help, labels)
+
+def gauge(name:str, help:str, labels:tuple=()) -> Gauge:
+    return _register(Gauge, name, help, labels)
+
+def histogram(name:str, help:str, labels:tuple=(), buckets:tuple=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+class Sampler:
+    """`if sampler(): ...` is true once every `every` calls; for measurements on per-trade paths."""
+
+    def __init__(self, every:int=100):
+        self.every, self.n = every, 0
+
+    def __call__(self) -> bool:
+        self.n += 1
+        if self.n >= self.every:
+            self.n = 0
+            return True
+        return False
+
+def exposition() -> str:
+    with _lock:
+        metrics = list(_registry.values())
+    return "\n".join(line for m in metrics for line in m.expose()) + "\n"
+
+def snapshot() -> dict:
+    with _lock:
+        metrics = list(_registry.values())
+    return {m.name: m.snapshot() for m in metrics}
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404); return
+        body = exposition().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def _log_loop(every:float):
+    while True:
+        time.sleep(every)
+        logging.info("metrics %s", json.dumps(snapshot(), separators=(",", ":"), default=str))
+
+def start(port:int=0, log_every:float=0, host:str="0.0.0.0"):
+    """Serve /metrics on `port` and/or log a JSON snapshot every `log_every` seconds (0 disables either)."""
+    if port:
+        srv = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=srv.serve_forever, daemon=True, name="metrics-http").start()
+        logging.info("metrics on http://%s:%d/metrics", host, port)
+    if log_every:
+        threading.Thread(target=_log_loop, args=(log_every,), daemon=True, name="metrics-log").start()
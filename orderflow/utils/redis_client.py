@@ -4,9 +4,9 @@ from settings import REDIS_URL
 redis_client = None  # type: aioredis.Redis | None
 
 async def init_redis():
-    """Initialise global async Redis connection."""
+    """Initialise global async Redis connection (raw bytes: trade entries are packed, see utils/codec.py)."""
     global redis_client
-    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    redis_client = aioredis.from_url(REDIS_URL, decode_responses=False)
 
 async def close_redis():
     """Close Redis connection gently."""
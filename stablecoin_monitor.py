@@ -3,20 +3,22 @@
 
 from __future__ import annotations
 
+import logging
 import time
 import sqlite3
 from pathlib import Path
 from typing import Dict, List
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 import requests
 import yaml
 
+from charts import RenderStage, draw_lines
+from notifier import Notifier
+
 CONFIG_FILE = Path("config.yaml")
 STABLECOINS = ["USDT", "USDC", "FDUSD", "TUSD", "DAI"]
+PRUNE_BATCH = 500
 
 
 def load_config() -> Dict[str, str]:
@@ -43,10 +45,20 @@ def init_db(path: Path) -> sqlite3.Connection:
     return con
 
 
-def prune_db(con: sqlite3.Connection, max_age: int) -> None:
+def prune_db(con: sqlite3.Connection, max_age: int, batch: int = PRUNE_BATCH) -> int:
+    """Delete at most `batch` rows older than `max_age` seconds; returns how many went.
+
+    In steady state one snapshot ages out per cycle, so this is a handful of index-range
+    deletes (the (ts, coin) primary key index serves the ts range). A backlog, e.g. after
+    lowering retention_days, drains over several cycles instead of one long write lock.
+    """
     threshold = int(time.time()) - max_age
-    con.execute("DELETE FROM history WHERE ts < ?", (threshold,))
+    cur = con.execute(
+        "DELETE FROM history WHERE rowid IN (SELECT rowid FROM history WHERE ts < ? ORDER BY ts LIMIT ?)",
+        (threshold, batch),
+    )
     con.commit()
+    return cur.rowcount
 
 
 def fetch_cmc(api_key: str, symbols: List[str]) -> Dict[str, Dict[str, float]]:
@@ -64,7 +76,7 @@ def fetch_cmc(api_key: str, symbols: List[str]) -> Dict[str, Dict[str, float]]:
     return results
 
 
-def save_snapshot(con: sqlite3.Connection, snapshot: Dict[str, Dict[str, float]]) -> None:
+def save_snapshot(con: sqlite3.Connection, snapshot: Dict[str, Dict[str, float]]) -> int:
     now = int(time.time())
     rows = [(now, c, d["price"], d["volume"]) for c, d in snapshot.items()]
     con.executemany(
@@ -72,65 +84,102 @@ def save_snapshot(con: sqlite3.Connection, snapshot: Dict[str, Dict[str, float]]
         rows,
     )
     con.commit()
-
-
-def load_week(con: sqlite3.Connection) -> pd.DataFrame:
-    one_week = int(time.time()) - 7 * 86400
-    df = pd.read_sql("SELECT * FROM history WHERE ts >= ?", con, params=(one_week,))
-    if not df.empty:
-        df["timestamp"] = pd.to_datetime(df["ts"], unit="s", utc=True)
-    return df
-
-
-def make_charts(df: pd.DataFrame, out_dir: Path) -> Path:
-    out_dir.mkdir(parents=True, exist_ok=True)
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
-    for coin, grp in df.groupby("coin"):
-        ax1.plot(grp["timestamp"], grp["price"], label=coin)
-        ax2.plot(grp["timestamp"], grp["volume"], label=coin)
-    ax1.set_title("Price (USD)")
-    ax1.legend()
-    ax2.set_title("24h Volume (USD)")
-    ax2.legend()
-    fig.autofmt_xdate()
-    path = out_dir / "stablecoins.png"
-    fig.tight_layout()
-    fig.savefig(path)
-    plt.close(fig)
-    return path
-
-
-def discord_notify(webhook: str, image_path: Path, text: str) -> None:
-    with image_path.open("rb") as fh:
-        files = {"file": (image_path.name, fh, "image/png")}
-        resp = requests.post(webhook, data={"content": text}, files=files, timeout=10)
-    resp.raise_for_status()
+    return now
+
+
+class HistoryRing:
+    """The chart window in memory: the last `capacity` snapshots as fixed-size arrays.
+
+    One ts column plus a price and a volume column per coin (NaN where a snapshot lacks
+    the coin). Appending overwrites the oldest slot, so a cycle costs O(coins) whatever
+    the window length.
+    """
+
+    def __init__(self, coins: List[str], capacity: int) -> None:
+        self.coins = list(coins)
+        self._col = {c: i for i, c in enumerate(self.coins)}
+        self.ts = np.zeros(capacity, np.int64)
+        self.price = np.full((capacity, len(self.coins)), np.nan)
+        self.volume = np.full((capacity, len(self.coins)), np.nan)
+        self.head = 0
+        self.size = 0
+
+    def append(self, ts: int, snapshot: Dict[str, Dict[str, float]]) -> None:
+        i = self.head
+        self.ts[i] = ts
+        self.price[i] = self.volume[i] = np.nan
+        for coin, d in snapshot.items():
+            j = self._col.get(coin)
+            if j is not None:
+                self.price[i, j] = d["price"]
+                self.volume[i, j] = d["volume"]
+        self.head = (i + 1) % len(self.ts)
+        self.size = min(self.size + 1, len(self.ts))
+
+    def seed(self, con: sqlite3.Connection, since: int) -> None:
+        """Load snapshots newer than `since` from the database; done once at startup."""
+        snap: Dict[str, Dict[str, float]] = {}
+        last = None
+        for ts, coin, price, volume in con.execute(
+            "SELECT ts, coin, price, volume FROM history WHERE ts >= ? ORDER BY ts", (since,)
+        ):
+            if ts != last and snap:
+                self.append(last, snap)
+                snap = {}
+            snap[coin] = {"price": price, "volume": volume}
+            last = ts
+        if snap:
+            self.append(last, snap)
+
+    def window(self, since: int):
+        """(ts, price, volume) of snapshots at or after `since`, oldest first."""
+        idx = (self.head - self.size + np.arange(self.size)) % len(self.ts)
+        idx = idx[self.ts[idx] >= since]
+        return self.ts[idx], self.price[idx], self.volume[idx]
+
+
+def make_charts(ring: HistoryRing, since: int, out_dir: Path, stage: RenderStage) -> Path | None:
+    """Price and volume chart of the window; returns its path, or None when nothing changed since the last draw."""
+    ts, price, volume = ring.window(since)
+    if not len(ts):
+        return None
+    job = (
+        out_dir / "stablecoins.png",
+        draw_lines,
+        (ts.astype("datetime64[s]").astype("datetime64[ms]"), ring.coins, price.T, volume.T,
+         ("Price (USD)", "24h Volume (USD)")),
+    )
+    drawn = stage.render([job])
+    return drawn[0] if drawn else None
 
 
 def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
     cfg = load_config()
     con = init_db(Path(cfg.get("db_path", "stablecoin_history.db")))
     api_key = cfg["coinmarketcap_key"]
     webhook = cfg.get("discord_webhook", "")
     interval = int(cfg.get("interval_sec", 300))
+    chart_sec = int(float(cfg.get("chart_days", 7)) * 86400)
+    retention_sec = max(int(float(cfg.get("retention_days", 7)) * 86400), chart_sec)
+    stage = RenderStage(workers=1)  # a single chart: draw inline, keep the change detection
+    notifier = Notifier(webhook) if webhook else None
+    # slack for cycles that run short; window() drops anything older than the chart span anyway
+    ring = HistoryRing(STABLECOINS, chart_sec // interval * 5 // 4 + 1)
+    ring.seed(con, int(time.time()) - chart_sec)
 
     while True:
         try:
             snap = fetch_cmc(api_key, STABLECOINS)
-            save_snapshot(con, snap)
-            prune_db(con, 7 * 86400)
-            df = load_week(con)
-            if not df.empty:
-                chart = make_charts(df, Path(cfg.get("chart_dir", "charts")))
-                latest_lines = [f"{c}: {d['price']:.4f} USD, vol {d['volume']:.0f}" for c, d in snap.items()]
-                if webhook:
-                    discord_notify(webhook, chart, "\n".join(latest_lines))
+            ring.append(save_snapshot(con, snap), snap)
+            prune_db(con, retention_sec)
+            chart = make_charts(ring, int(time.time()) - chart_sec, Path(cfg.get("chart_dir", "charts")), stage)
+            latest_lines = [f"{c}: {d['price']:.4f} USD, vol {d['volume']:.0f}" for c, d in snap.items()]
+            if notifier and chart:
+                notifier.notify("\n".join(latest_lines), [chart], key="chart")
         except Exception as e:
-            if webhook:
-                try:
-                    requests.post(webhook, json={"content": f"Error: {e}"}, timeout=10)
-                except Exception:
-                    pass
+            if notifier:
+                notifier.notify(f"Error: {e}", key="error")
         time.sleep(interval)
 
 